@@ -0,0 +1,173 @@
+"""Throughput benchmark of the send path against the local mock server.
+
+    python benchmarks/bench_send.py --sizes 1000 10000 100000 --latency 0.05 --json bench.json
+
+Every scenario runs in a fresh process, so peak RSS is that scenario's own. Reported per scenario:
+messages/sec, p50/p99 latency of one Ultramsg request (including retries) and peak RSS.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_server import create_server  # noqa: E402
+
+TEMPLATES = {
+    "chat": "{{Name}}: {{Text}}",
+    "photo": "{{Photo (default)}}{{Name}}: {{Photo caption}}",
+    "video": "{{Video (default)}}{{Name}}: {{Video caption}}",
+}
+SCENARIOS = ("chat", "photo", "video", "read")
+
+
+def serve(port_queue, rows, latency, error_rate, throttle_rate):
+    server = create_server(0, rows, latency, error_rate, throttle_rate)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def write_service_account(directory, base_url):
+    # A throwaway key; the mock /token endpoint accepts any signed assertion
+    import rsa
+
+    _, private_key = rsa.newkeys(1024)
+    path = os.path.join(directory, "service_account.json")
+    with open(path, "w") as file:
+        json.dump({
+            "type": "service_account",
+            "project_id": "benchmark",
+            "private_key_id": "benchmark",
+            "private_key": private_key.save_pkcs1().decode("ascii"),
+            "client_email": "benchmark@benchmark.iam.gserviceaccount.com",
+            "client_id": "0",
+            "token_uri": f"{base_url}/token",
+        }, file)
+    return path
+
+
+def percentile(values, share):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+def format_number(value):
+    return f"{value:>9.1f}" if value is not None else f"{'-':>9}"
+
+
+def run_scenario(scenario, base_url, service_account_file, concurrency, batch_size, result_queue):
+    import ultramsg_client
+    from read import open_selected_rows
+    from send_messages import send_whatsapp_message, send_whatsapp_photo, send_whatsapp_video
+
+    latencies = []
+    original_post = ultramsg_client.UltramsgClient.post
+
+    def timed_post(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return original_post(self, *args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - started)
+
+    # post() is timed rather than send(), so batched sends are measured the same way
+    ultramsg_client.UltramsgClient.post = timed_post
+
+    outcome = {"scenario": scenario}
+    started = time.perf_counter()
+
+    if scenario == "read":
+        rows = open_selected_rows(service_account_file, "benchmark", 1, api_endpoint=base_url,
+                                  error_callback=lambda message: outcome.update(error=message))
+        outcome["messages"] = sum(1 for _ in rows) if rows else 0
+    else:
+        senders = {"chat": send_whatsapp_message, "photo": send_whatsapp_photo, "video": send_whatsapp_video}
+        config = {
+            "ultramsg_instance_id": "benchmark",
+            "ultramsg_token": "benchmark",
+            "ultramsg_api_url": base_url,
+            "service_account_file": service_account_file,
+            "sheets_api_url": base_url,
+            "spreadsheet_id": "benchmark",
+            "sheet_number": "1",
+            "message_delay": "0",
+            "concurrency": concurrency,
+            "batch_size": batch_size,
+            # The benchmark measures the client, so let the rate limiter open up completely
+            "rate_limit": 1e6,
+            "max_rate_limit": 1e6,
+        }
+        senders[scenario](format=TEMPLATES[scenario], config=config,
+                          completion_callback=lambda sent, not_sent: outcome.update(messages=sent, not_sent=not_sent),
+                          error_callback=lambda message: outcome.update(error=message))
+
+    elapsed = time.perf_counter() - started
+    outcome["seconds"] = round(elapsed, 3)
+    outcome["messages_per_second"] = round(outcome.get("messages", 0) / elapsed, 1) if elapsed else None
+    outcome["p50_ms"] = round(percentile(latencies, 0.50) * 1000, 2) if latencies else None
+    outcome["p99_ms"] = round(percentile(latencies, 0.99) * 1000, 2) if latencies else None
+    # ru_maxrss is in kilobytes on Linux
+    outcome["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    result_queue.put(outcome)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=1, help="messages coalesced into one send task")
+    parser.add_argument("--latency", type=float, default=0.05, help="mean mock response time, seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    results = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            port_queue = context.Queue()
+            server = context.Process(target=serve, daemon=True,
+                                     args=(port_queue, size, args.latency, args.error_rate, args.throttle_rate))
+            server.start()
+            base_url = f"http://127.0.0.1:{port_queue.get()}"
+            service_account_file = write_service_account(directory, base_url)
+
+            try:
+                for scenario in args.scenarios:
+                    result_queue = context.Queue()
+                    worker = context.Process(target=run_scenario, args=(scenario, base_url, service_account_file,
+                                                                        args.concurrency, args.batch_size,
+                                                                        result_queue))
+                    worker.start()
+                    worker.join()
+                    if worker.exitcode == 0:
+                        outcome = result_queue.get()
+                    else:
+                        outcome = {"scenario": scenario, "messages_per_second": None, "p50_ms": None, "p99_ms": None,
+                                   "peak_rss_mb": 0, "error": f"benchmark process exited with {worker.exitcode}"}
+                    outcome["rows"] = size
+                    results.append(outcome)
+                    print(f"{scenario:>6} {size:>7} rows  {format_number(outcome['messages_per_second'])} msg/s  "
+                          f"p50 {format_number(outcome['p50_ms'])} ms  p99 {format_number(outcome['p99_ms'])} ms  "
+                          f"peak RSS {format_number(outcome['peak_rss_mb'])} MB"
+                          + (f"  error: {outcome['error']}" if "error" in outcome else ""))
+            finally:
+                server.terminate()
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Start-up time of the GUI, tracked per release.
+
+    python benchmarks/bench_startup.py --runs 10 --json startup.json
+
+Every run is a fresh interpreter. Reported as the median of all runs:
+- process: from launching the interpreter until the measurements below are done
+- import main: time to import main.py
+- first window: from before `import main` until the main window is mapped (needs a display)
+- sending stack: time the background warm-up takes to import the senders afterwards
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+METRICS = ("process_ms", "import_main_ms", "first_window_ms", "sending_stack_ms")
+
+
+def measure():
+    # Runs in the child interpreter; prints one JSON object
+    sys.path.insert(0, ROOT)
+    outcome = {}
+
+    started = time.perf_counter()
+    import main
+    outcome["import_main_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    try:
+        # No warm-up in the measurement, it is timed on its own below
+        main.WARM_UP_DELAY_MS = 60 * 60 * 1000
+        app = main.MainApplication()
+        while not app.winfo_viewable():
+            app.update()
+        outcome["first_window_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        app.destroy()
+    except Exception as e:
+        # tkinter raises TclError without a display, e.g. on a CI machine
+        outcome["first_window_ms"] = None
+        outcome["error"] = str(e).splitlines()[0]
+
+    stack_started = time.perf_counter()
+    main.load_sending_stack()
+    outcome["sending_stack_ms"] = round((time.perf_counter() - stack_started) * 1000, 2)
+    print(json.dumps(outcome))
+
+
+def median(values):
+    values = [value for value in values if value is not None]
+    return round(statistics.median(values), 2) if values else None
+
+
+def format_number(value):
+    return f"{value:>9.1f}" if value is not None else f"{'-':>9}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        measure()
+        return
+
+    runs = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), "--child"], cwd=ROOT,
+                                capture_output=True, text=True)
+        process_ms = round((time.perf_counter() - started) * 1000, 2)
+        if result.returncode != 0:
+            print(result.stderr, file=sys.stderr)
+            sys.exit(f"benchmark process exited with {result.returncode}")
+        outcome = json.loads(result.stdout.strip().splitlines()[-1])
+        outcome["process_ms"] = process_ms
+        runs.append(outcome)
+
+    summary = {metric: median([run.get(metric) for run in runs]) for metric in METRICS}
+    summary["runs"] = len(runs)
+    errors = {run["error"] for run in runs if "error" in run}
+    if errors:
+        summary["error"] = "; ".join(sorted(errors))
+
+    print(f"process {format_number(summary['process_ms'])} ms  "
+          f"import main {format_number(summary['import_main_ms'])} ms  "
+          f"first window {format_number(summary['first_window_ms'])} ms  "
+          f"sending stack {format_number(summary['sending_stack_ms'])} ms"
+          + (f"  error: {summary['error']}" if errors else ""))
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({"summary": summary, "runs": runs}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
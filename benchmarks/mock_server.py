@@ -0,0 +1,188 @@
+"""Local stand-in for the Ultramsg API and the Google Sheets values endpoint.
+
+    python benchmarks/mock_server.py --port 8765 --rows 10000 --latency 0.05 --error-rate 0.01
+
+Ultramsg:  POST /{instance_id}/messages/chat|image|video, POST /{instance_id}/instance/settings,
+           POST /{instance_id}/media/upload
+Sheets:    GET  /v4/spreadsheets/{spreadsheet_id}/values/{range},
+           POST /v4/spreadsheets/{spreadsheet_id}/values:batchUpdate
+Drive:     GET  /files/{spreadsheet_id} (the version the sheet cache revalidates against)
+OAuth:     POST /token (for the throwaway service account written by the benchmarks)
+"""
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+MESSAGE_PATH = re.compile(r"^/([^/]+)/messages/(chat|image|video)$")
+SETTINGS_PATH = re.compile(r"^/([^/]+)/instance/settings$")
+UPLOAD_PATH = re.compile(r"^/([^/]+)/media/upload$")
+VALUES_PATH = re.compile(r"^/v4/spreadsheets/([^/]+)/values/(.+)$")
+BATCH_UPDATE_PATH = re.compile(r"^/v4/spreadsheets/([^/]+)/values:batchUpdate$")
+FILE_PATH = re.compile(r"^/files/([^/]+)$")
+RANGE = re.compile(r"^[^!]+!(\d+):(\d+)$")
+
+HEADERS = ["Select", "Name", "Phone number", "text", "photo url", "photo caption", "video url", "video caption"]
+
+
+class MockState:
+    def __init__(self, rows, latency, error_rate, throttle_rate, retry_after, blank_rows=()):
+        self.rows = rows
+        # Row numbers left empty, e.g. separator rows
+        self.blank_rows = set(blank_rows)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.message_ids = itertools.count(1)
+        self.counts = {"messages": 0, "errors": 0, "throttled": 0, "sheet_pages": 0, "uploads": 0, "sheet_writes": 0,
+                       "version_checks": 0}
+        # Drive version of the sheet; bump it to make cached copies stale
+        self.version = 1
+        # Cells written with values:batchUpdate, by A1 reference
+        self.written = {}
+        self.lock = threading.Lock()
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def sheet_row(self, row_number):
+        if row_number == 1:
+            return HEADERS
+        if row_number in self.blank_rows:
+            return []
+        index = row_number - 1
+        return ["TRUE", f"Name {index}", f"+1555{index:07d}", f"Text {index}",
+                f"https://example.com/photo/{index}.jpg", f"Photo {index}",
+                f"https://example.com/video/{index}.mp4", f"Video {index}"]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real APIs
+    # Headers and body go out in separate writes; without TCP_NODELAY delayed ACKs add ~40 ms per request
+    disable_nagle_algorithm = True
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def do_POST(self):
+        body = self.read_body()
+        path = urlparse(self.path).path
+
+        if BATCH_UPDATE_PATH.match(path):
+            self.state.count("sheet_writes")
+            data = json.loads(body).get("data", [])
+            with self.state.lock:
+                for value_range in data:
+                    self.state.written[value_range["range"]] = value_range["values"]
+            self.send_json(200, {"totalUpdatedCells": sum(len(value_range["values"]) for value_range in data)})
+            return
+
+        if path == "/token":
+            self.send_json(200, {"access_token": "mock-token", "token_type": "Bearer", "expires_in": 3600})
+            return
+
+        if SETTINGS_PATH.match(path):
+            self.send_json(200, {"success": "true"})
+            return
+
+        if UPLOAD_PATH.match(path):
+            self.state.count("uploads")
+            self.send_json(200, {"success": f"https://mock.ultramsg.local/media/{next(self.state.message_ids)}"})
+            return
+
+        if not MESSAGE_PATH.match(path):
+            self.send_json(404, {"error": "not found"})
+            return
+
+        state = self.state
+        if state.latency:
+            # Exponential around the mean, which gives the long tail a real API has
+            time.sleep(random.expovariate(1 / state.latency))
+
+        roll = random.random()
+        if roll < state.throttle_rate:
+            state.count("throttled")
+            self.send_json(429, {"error": "Too many requests"}, {"Retry-After": str(state.retry_after)})
+        elif roll < state.throttle_rate + state.error_rate:
+            state.count("errors")
+            self.send_json(500, {"error": "Internal error"})
+        else:
+            state.count("messages")
+            self.send_json(200, {"sent": "true", "message": "ok", "id": next(state.message_ids)})
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if FILE_PATH.match(path):
+            self.state.count("version_checks")
+            self.send_json(200, {"version": str(self.state.version), "modifiedTime": "2024-01-01T00:00:00.000Z"})
+            return
+
+        match = VALUES_PATH.match(path)
+        if not match:
+            self.send_json(404, {"error": "not found"})
+            return
+
+        range_name = unquote(match.group(2))
+        bounds = RANGE.match(range_name)
+        start, end = (int(bounds.group(1)), int(bounds.group(2))) if bounds else (1, self.state.rows + 1)
+        end = min(end, self.state.rows + 1)
+        self.state.count("sheet_pages")
+        values = [self.state.sheet_row(row_number) for row_number in range(start, end + 1)]
+        # Like the real API, trailing empty rows are left out
+        while values and not values[-1]:
+            values.pop()
+        self.send_json(200, {"range": range_name, "majorDimension": "ROWS", "values": values})
+
+
+def create_server(port=0, rows=1000, latency=0.0, error_rate=0.0, throttle_rate=0.0, retry_after=1, blank_rows=()):
+    state = MockState(rows, latency, error_rate, throttle_rate, retry_after, blank_rows)
+    handler = type("BoundMockHandler", (MockHandler,), {"state": state})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    server.state = state
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rows", type=int, default=1000, help="selected rows in the mock sheet")
+    parser.add_argument("--latency", type=float, default=0.05, help="mean response time of a send, seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of sends answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of sends answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429")
+    args = parser.parse_args()
+
+    server = create_server(args.port, args.rows, args.latency, args.error_rate, args.throttle_rate, args.retry_after)
+    print(f"Mock Ultramsg/Sheets server on http://127.0.0.1:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(server.state.counts))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Settings of one campaign as a typed, immutable object.
+
+A config is loaded once from a settings profile and handed to run_campaign explicitly, so campaigns
+running side by side in one process can each use their own Ultramsg instances and spreadsheet.
+"""
+import dataclasses
+from dataclasses import dataclass, field
+from typing import Optional, get_args
+
+from send_engine import DEFAULT_CONCURRENCY, DEFAULT_BATCH_SIZE, DEFAULT_FLUSH_INTERVAL
+from settings import read_settings_file
+
+TRUE_VALUES = ("1", "true", "yes", "on")
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+CONVERTERS = {str: str, int: int, float: float, bool: parse_bool}
+
+
+@dataclass(frozen=True)
+class CampaignConfig:
+    """Everything run_campaign reads. None means the default of the module that uses the value."""
+
+    ultramsg_instance_id: str = ""
+    # Tokens are left out of repr(), so a config can be logged
+    ultramsg_token: str = field(default="", repr=False)
+    # Extra instances as "id:token, id:token"
+    ultramsg_instances: str = field(default="", repr=False)
+    ultramsg_api_url: Optional[str] = None
+    service_account_file: str = ""
+    spreadsheet_id: str = ""
+    sheet_number: int = 1
+    sheets_api_url: Optional[str] = None
+    recipients_file: str = ""
+    message_delay: int = 1
+    concurrency: int = DEFAULT_CONCURRENCY
+    # Worker processes the rows are partitioned over, see partitions.py
+    processes: int = 1
+    batch_size: int = DEFAULT_BATCH_SIZE
+    flush_interval: float = DEFAULT_FLUSH_INTERVAL
+    pool_size: Optional[int] = None
+    connect_timeout: Optional[float] = None
+    read_timeout: Optional[float] = None
+    rate_limit: Optional[float] = None
+    max_rate_limit: Optional[float] = None
+    max_attempts: Optional[int] = None
+    default_country_code: str = ""
+    preflight: bool = True
+    # Write status, time and message ID of every row back to the Google Sheet
+    write_back: bool = False
+    journal_path: Optional[str] = None
+    sheet_cache_dir: Optional[str] = None
+    media_cache_path: Optional[str] = None
+    status_store_path: Optional[str] = None
+    metrics_port: Optional[int] = None
+    metrics_path: Optional[str] = None
+    # Set by the scheduler: end of the window (epoch seconds) and the rate shared by all of its jobs
+    spread_until: Optional[float] = None
+    global_rate_limit: Optional[float] = None
+
+    @classmethod
+    def from_dict(cls, values):
+        """Parse settings-style values: strings from an .ini file or JSON from the campaign queue.
+
+        Unknown keys are ignored and empty values keep the default.
+        """
+        parsed = {}
+        for config_field in dataclasses.fields(cls):
+            name = config_field.name
+            value = values.get(name)
+            if value is None or value == "":
+                continue
+            # Optional[int] -> int
+            kind = next((arg for arg in get_args(config_field.type) if arg is not type(None)), config_field.type)
+            try:
+                parsed[name] = CONVERTERS[kind](value)
+            except ValueError:
+                raise ValueError(f"Invalid {name.upper()}: {value!r}")
+        return cls(**parsed)
+
+    def replace(self, **changes):
+        return dataclasses.replace(self, **changes)
+
+    def as_dict(self):
+        return dataclasses.asdict(self)
+
+
+def load_profile(profile=None, settings_path=None, **overrides):
+    """The config of a settings profile (the [Settings] section when `profile` is None), with `overrides`."""
+    return CampaignConfig.from_dict(read_settings_file(settings_path, profile)).replace(**overrides)
@@ -0,0 +1,346 @@
+"""Persistent queue of scheduled campaigns and the scheduler that runs them.
+
+    python campaign_queue.py add --start "2026-01-31 01:00" --end "2026-01-31 05:00" --type chat --template message.txt
+    python campaign_queue.py list
+    python campaign_queue.py cancel 3
+    python campaign_queue.py run --jobs 2 --global-rate 10
+
+`add` takes the options of cli.py and stores the settings of that moment with the job. `run` starts every
+job when its window opens and spreads its messages evenly over the window, with up to `--jobs` campaigns
+at a time sharing `--global-rate` messages per second.
+"""
+import argparse
+import json
+import logging
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+from campaign_config import CampaignConfig
+from log_sink import LogSink, configure_logging
+from pipeline import run_campaign, MESSAGE_TYPES
+from send_engine import SendControl
+from settings import get_app_file, get_log_path, CAMPAIGN_QUEUE_FILE
+
+STATE_QUEUED = "queued"
+STATE_RUNNING = "running"
+STATE_DONE = "done"
+STATE_FAILED = "failed"
+STATE_CANCELLED = "cancelled"
+STATE_MISSED = "missed"
+
+DEFAULT_MAX_JOBS = 2
+POLL_INTERVAL = 5.0  # seconds between looks at the queue
+# A running job whose scheduler has not touched it for this long belongs to a scheduler that died
+STALE_AFTER = 6 * POLL_INTERVAL
+
+# cli.py names the message types after the GUI sections
+MESSAGE_KINDS = {"chat": "chat", "photo": "image", "video": "video"}
+
+logger = logging.getLogger(__name__)
+
+
+def parse_time(value):
+    # "2026-01-31 01:00" in local time, or a Unix time
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.strptime(value, "%Y-%m-%d %H:%M").timestamp()
+
+
+def format_time(value):
+    return datetime.fromtimestamp(value).strftime("%Y-%m-%d %H:%M") if value else "-"
+
+
+class CampaignQueue:
+    """Scheduled campaigns in SQLite, so they survive restarts and can be added from any process."""
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, "
+            "format TEXT NOT NULL, config TEXT NOT NULL, window_start REAL NOT NULL, window_end REAL NOT NULL, "
+            "state TEXT NOT NULL, created REAL, started REAL, heartbeat REAL, finished REAL, sent INTEGER, "
+            "not_sent INTEGER, error TEXT)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, window_start)")
+        self.connection.commit()
+
+    def add(self, kind, format, config, window_start, window_end):
+        if kind not in MESSAGE_TYPES:
+            raise ValueError(f"Unknown message type: {kind}")
+        if window_end <= window_start:
+            raise ValueError("The window has to end after it starts")
+        if not isinstance(config, CampaignConfig):
+            config = CampaignConfig.from_dict(config)
+        with self.lock:
+            cursor = self.connection.execute(
+                "INSERT INTO jobs (kind, format, config, window_start, window_end, state, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (kind, format, json.dumps(config.as_dict()), window_start, window_end, STATE_QUEUED, time.time()))
+            self.connection.commit()
+            return cursor.lastrowid
+
+    def jobs(self, states=None):
+        query = "SELECT id, kind, format, config, window_start, window_end, state, started, finished, sent, " \
+                "not_sent, error FROM jobs"
+        parameters = ()
+        if states:
+            query += f" WHERE state IN ({','.join('?' * len(states))})"
+            parameters = tuple(states)
+        with self.lock:
+            rows = self.connection.execute(query + " ORDER BY window_start, id", parameters).fetchall()
+        names = ("id", "kind", "format", "config", "window_start", "window_end", "state", "started", "finished",
+                 "sent", "not_sent", "error")
+        jobs = [dict(zip(names, row)) for row in rows]
+        for job in jobs:
+            job["config"] = CampaignConfig.from_dict(json.loads(job["config"]))
+        return jobs
+
+    def claim(self, job_id):
+        # Only one scheduler gets a job, even with the GUI and a headless scheduler on the same queue
+        with self.lock:
+            now = time.time()
+            cursor = self.connection.execute(
+                "UPDATE jobs SET state = ?, started = ?, heartbeat = ? WHERE id = ? AND state = ?",
+                (STATE_RUNNING, now, now, job_id, STATE_QUEUED))
+            self.connection.commit()
+            return cursor.rowcount == 1
+
+    def finish(self, job_id, state, sent=None, not_sent=None, error=None):
+        with self.lock:
+            self.connection.execute(
+                "UPDATE jobs SET state = ?, finished = ?, sent = ?, not_sent = ?, error = ? WHERE id = ?",
+                (state, time.time(), sent, not_sent, error, job_id))
+            self.connection.commit()
+
+    def cancel(self, job_id):
+        with self.lock:
+            cursor = self.connection.execute("UPDATE jobs SET state = ?, finished = ? WHERE id = ? AND state = ?",
+                                             (STATE_CANCELLED, time.time(), job_id, STATE_QUEUED))
+            self.connection.commit()
+            return cursor.rowcount == 1
+
+    def release(self, job_id):
+        # Back to the queue, e.g. when the scheduler is stopped in the middle of the job
+        with self.lock:
+            self.connection.execute("UPDATE jobs SET state = ? WHERE id = ? AND state = ?",
+                                    (STATE_QUEUED, job_id, STATE_RUNNING))
+            self.connection.commit()
+
+    def heartbeat(self, job_ids):
+        if not job_ids:
+            return
+        with self.lock:
+            self.connection.executemany("UPDATE jobs SET heartbeat = ? WHERE id = ?",
+                                        [(time.time(), job_id) for job_id in job_ids])
+            self.connection.commit()
+
+    def requeue_stale(self, stale_after=STALE_AFTER):
+        # Jobs left running by a scheduler that died; the send journal lets them resume where they stopped
+        with self.lock:
+            self.connection.execute("UPDATE jobs SET state = ? WHERE state = ? AND heartbeat < ?",
+                                    (STATE_QUEUED, STATE_RUNNING, time.time() - stale_after))
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class CampaignScheduler:
+    """Runs queued campaigns when their window opens, up to `max_jobs` at a time.
+
+    Every job is spread over its window, and all of them together stay under `global_rate` messages
+    per second. `on_log(job_id, message)` receives the log lines of every job.
+    """
+
+    def __init__(self, campaign_queue, max_jobs=DEFAULT_MAX_JOBS, global_rate=None, poll_interval=POLL_INTERVAL,
+                 on_log=None):
+        self.queue = campaign_queue
+        self.max_jobs = max_jobs
+        self.global_rate = global_rate
+        self.poll_interval = poll_interval
+        self.on_log = on_log
+        self.running = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def log(self, job_id, message):
+        if self.on_log:
+            self.on_log(job_id, message)
+
+    def poll(self):
+        with self.lock:
+            running = list(self.running)
+        self.queue.heartbeat(running)
+        self.queue.requeue_stale(max(STALE_AFTER, 6 * self.poll_interval))
+
+        now = time.time()
+        for job in self.queue.jobs([STATE_QUEUED]):
+            with self.lock:
+                if len(self.running) >= self.max_jobs:
+                    return
+            if job["window_start"] > now:
+                # Jobs are ordered by window start, so nothing later is due either
+                return
+            if job["window_end"] <= now:
+                # The window went by while no scheduler was running; sending now could be at night
+                if self.queue.claim(job["id"]):
+                    self.queue.finish(job["id"], STATE_MISSED)
+                    self.log(job["id"], f"Window ended at {format_time(job['window_end'])}, job skipped")
+                continue
+            if self.queue.claim(job["id"]):
+                self.start_job(job)
+
+    def start_job(self, job):
+        control = SendControl()
+        with self.lock:
+            self.running[job["id"]] = control
+        thread = threading.Thread(target=self.run_job, args=(job, control), daemon=True,
+                                  name=f"campaign-{job['id']}")
+        thread.start()
+
+    def run_job(self, job, control):
+        job_id = job["id"]
+        config = job["config"].replace(spread_until=job["window_end"],
+                                       global_rate_limit=self.global_rate or job["config"].global_rate_limit)
+        result = {}
+        self.log(job_id, f"Started, spreading messages until {format_time(job['window_end'])}")
+        try:
+            run_campaign(MESSAGE_TYPES[job["kind"]], job["format"], config,
+                         write_log_callback=lambda message: self.log(job_id, message),
+                         completion_callback=lambda sent, not_sent: result.update(sent=sent, not_sent=not_sent),
+                         error_callback=lambda message: result.update(error=message),
+                         control=control)
+        except Exception as e:
+            logger.exception("Campaign job %s failed", job_id)
+            result["error"] = f"Sending failed: {e}"
+        finally:
+            with self.lock:
+                self.running.pop(job_id, None)
+
+        if control.cancelled and self.stopped.is_set():
+            # Stopped with the scheduler rather than cancelled; the journal resumes it next time
+            self.queue.release(job_id)
+            self.log(job_id, "Stopped, will resume when the scheduler runs again")
+            return
+        if control.cancelled:
+            state = STATE_CANCELLED
+        elif "error" in result or "sent" not in result:
+            state = STATE_FAILED
+        else:
+            state = STATE_DONE
+        self.queue.finish(job_id, state, result.get("sent"), result.get("not_sent"), result.get("error"))
+        self.log(job_id, f"Finished: {state}" + (f", {result['error']}" if "error" in result else ""))
+
+    def cancel(self, job_id):
+        # A queued job is taken off the queue, a running one stops after its requests in flight
+        with self.lock:
+            control = self.running.get(job_id)
+        if control:
+            control.cancel()
+            return True
+        return self.queue.cancel(job_id)
+
+    def run_forever(self):
+        while not self.stopped.is_set():
+            try:
+                self.poll()
+            except sqlite3.Error as e:
+                logger.error("Could not read the campaign queue: %s", e)
+            self.stopped.wait(self.poll_interval)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run_forever, daemon=True, name="campaign-scheduler")
+        self.thread.start()
+        return self
+
+    def stop(self, cancel_running=False):
+        self.stopped.set()
+        if cancel_running:
+            with self.lock:
+                controls = list(self.running.values())
+            for control in controls:
+                control.cancel()
+
+    def wait_idle(self):
+        while True:
+            with self.lock:
+                if not self.running:
+                    return
+            time.sleep(0.2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Schedule campaigns into time windows and run them.")
+    parser.add_argument("--queue", default=get_app_file(CAMPAIGN_QUEUE_FILE), help="campaign queue file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="queue a campaign; other options are those of cli.py")
+    add.add_argument("--start", required=True, help='window start, "YYYY-MM-DD HH:MM"')
+    add.add_argument("--end", required=True, help='window end, "YYYY-MM-DD HH:MM"')
+    commands.add_parser("list", help="show the queued and past jobs")
+    cancel = commands.add_parser("cancel", help="cancel a queued job")
+    cancel.add_argument("job_id", type=int)
+    run = commands.add_parser("run", help="run due jobs until interrupted")
+    run.add_argument("--jobs", type=int, default=DEFAULT_MAX_JOBS, help="campaigns running at the same time")
+    run.add_argument("--global-rate", type=float, help="messages per second for all jobs together")
+    run.add_argument("--log-level", default="INFO", choices=("DEBUG", "INFO", "WARNING", "ERROR"))
+    run.add_argument("--log-file", default=get_log_path("scheduler.log"), help="rotating file of the job logs")
+
+    args, rest = parser.parse_known_args(argv)
+    campaign_queue = CampaignQueue(args.queue)
+
+    if args.command == "add":
+        # Same options, settings and defaults as a headless send
+        import cli
+
+        try:
+            send_args = cli.parse_args(rest)
+            config = cli.build_config(send_args)
+            with open(send_args.template, encoding="utf-8") as file:
+                message_format = file.read().rstrip("\n")
+            job_id = campaign_queue.add(MESSAGE_KINDS[send_args.type], message_format, config,
+                                        parse_time(args.start), parse_time(args.end))
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 2
+        print(f"Queued job {job_id}")
+    elif rest:
+        parser.error(f"unrecognized arguments: {' '.join(rest)}")
+    elif args.command == "list":
+        for job in campaign_queue.jobs():
+            counts = f"{job['sent']} sent, {job['not_sent']} not sent" if job["sent"] is not None else ""
+            print(f"{job['id']:>4}  {job['state']:<9}  {job['kind']:<5}  {format_time(job['window_start'])} - "
+                  f"{format_time(job['window_end'])}  {counts}{job['error'] or ''}")
+    elif args.command == "cancel":
+        if not campaign_queue.cancel(args.job_id):
+            print(f"Job {args.job_id} is not queued", file=sys.stderr)
+            return 1
+    elif args.command == "run":
+        configure_logging(getattr(logging, args.log_level))
+        # Job logs hold a line per message, more than the rate limited diagnostics on stderr let through
+        log_sink = LogSink(args.log_file)
+        logger.info("Writing job logs to %s", args.log_file)
+        scheduler = CampaignScheduler(campaign_queue, max_jobs=args.jobs, global_rate=args.global_rate,
+                                      on_log=lambda job_id, message: log_sink.write(f"[job {job_id}] {message}"))
+        try:
+            scheduler.run_forever()
+        except KeyboardInterrupt:
+            # Running jobs go back to the queue and resume from the journal on the next start
+            scheduler.stop(cancel_running=True)
+            scheduler.wait_idle()
+        finally:
+            log_sink.close()
+
+    campaign_queue.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
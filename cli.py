@@ -0,0 +1,165 @@
+import argparse
+import json
+import logging
+import signal
+import sys
+
+from campaign_config import CampaignConfig
+from log_sink import configure_logging
+from send_engine import SendControl, DEFAULT_CONCURRENCY
+from send_messages import send_whatsapp_message, send_whatsapp_photo, send_whatsapp_video
+from settings import read_settings_file, get_app_file, get_sheet_cache_dir, JOURNAL_FILE, MEDIA_CACHE_FILE, \
+    STATUS_STORE_FILE
+
+SENDERS = {
+    "chat": send_whatsapp_message,
+    "photo": send_whatsapp_photo,
+    "video": send_whatsapp_video,
+}
+
+REQUIRED_SETTINGS = ("service_account_file", "spreadsheet_id")
+
+EXIT_OK = 0
+EXIT_NOT_ALL_SENT = 1
+EXIT_ERROR = 2
+EXIT_CANCELLED = 130
+
+logger = logging.getLogger(__name__)
+
+
+def emit(event, **fields):
+    # One JSON object per line, so the output can be piped into log collectors or jq
+    sys.stdout.write(json.dumps({"event": event, **fields}, ensure_ascii=False) + "\n")
+    sys.stdout.flush()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Send a WhatsApp campaign through Ultramsg without the GUI.")
+    parser.add_argument("--type", choices=sorted(SENDERS), default="chat", help="kind of message to send")
+    parser.add_argument("--template", required=True,
+                        help="file with the message format, e.g. '{{Name}}, your order is ready'")
+    parser.add_argument("--settings", help="settings .ini file (defaults to the one saved by the GUI)")
+    parser.add_argument("--profile", help="[Profile NAME] section of the settings file to use, e.g. another "
+                                          "instance or spreadsheet")
+    parser.add_argument("--spreadsheet-id", help="overrides SPREADSHEET_ID from the settings")
+    parser.add_argument("--sheet-number", help="overrides SHEET_NUMBER from the settings")
+    parser.add_argument("--recipients", help="read recipients from a local .csv, .tsv, .xlsx or .parquet file "
+                                             "instead of the Google Sheet (overrides RECIPIENTS_FILE)")
+    parser.add_argument("--concurrency", type=int, help="messages in flight (default from settings or "
+                                                        f"{DEFAULT_CONCURRENCY})")
+    parser.add_argument("--journal", default=get_app_file(JOURNAL_FILE),
+                        help="send journal used to resume interrupted campaigns")
+    parser.add_argument("--no-journal", action="store_true", help="do not record or resume the campaign")
+    parser.add_argument("--sheet-cache", default=get_sheet_cache_dir(), help="directory of the local sheet cache")
+    parser.add_argument("--no-sheet-cache", action="store_true", help="always download the sheet")
+    parser.add_argument("--media-cache", default=get_app_file(MEDIA_CACHE_FILE),
+                        help="cache of uploaded local photos/videos, keyed by file content")
+    parser.add_argument("--status-store", default=get_app_file(STATUS_STORE_FILE),
+                        help="store of delivery statuses, filled by webhook_server.py")
+    parser.add_argument("--processes", type=int, help="worker processes the rows are split over, for very "
+                                                      "large campaigns (default from settings or 1)")
+    parser.add_argument("--batch-size", type=int, help="messages coalesced into one send task (default from "
+                                                       "settings or 1)")
+    parser.add_argument("--flush-interval", type=float, help="seconds a partial batch waits for more messages")
+    parser.add_argument("--log-level", default="WARNING", choices=("DEBUG", "INFO", "WARNING", "ERROR"),
+                        help="level of diagnostics written to stderr")
+    parser.add_argument("--metrics-port", type=int, help="serve per-stage metrics at http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--metrics-json", help="write per-stage metrics to this JSON file when done")
+    parser.add_argument("--write-back", action="store_true",
+                        help="write status, time and message ID of every row back to the sheet (needs edit access)")
+    parser.add_argument("--no-preflight", action="store_true",
+                        help="skip validating and deduplicating the rows before sending")
+    parser.add_argument("--country-code", help="country code for numbers without '+' (overrides "
+                                               "DEFAULT_COUNTRY_CODE from the settings)")
+    return parser.parse_args(argv)
+
+
+def build_config(args):
+    settings = read_settings_file(args.settings, args.profile)
+    if args.spreadsheet_id:
+        settings["spreadsheet_id"] = args.spreadsheet_id
+    if args.sheet_number:
+        settings["sheet_number"] = args.sheet_number
+    if args.recipients:
+        settings["recipients_file"] = args.recipients
+
+    # The Google Sheet settings are not needed when the recipients come from a local file
+    required = () if settings.get("recipients_file") else REQUIRED_SETTINGS
+    missing = [key.upper() for key in required if not settings.get(key)]
+    if not settings.get("ultramsg_instances") and not (settings.get("ultramsg_instance_id")
+                                                       and settings.get("ultramsg_token")):
+        missing += ["ULTRAMSG_INSTANCE_ID", "ULTRAMSG_TOKEN"]
+    if missing:
+        raise ValueError(f"Missing settings: {', '.join(missing)}")
+
+    # Options given on the command line win over the settings file
+    options = {"concurrency": args.concurrency, "processes": args.processes, "batch_size": args.batch_size,
+               "flush_interval": args.flush_interval, "default_country_code": args.country_code,
+               "write_back": args.write_back}
+    settings.update({key: value for key, value in options.items() if value})
+    return CampaignConfig.from_dict(settings).replace(
+        journal_path=None if args.no_journal else args.journal,
+        sheet_cache_dir=None if args.no_sheet_cache else args.sheet_cache,
+        media_cache_path=args.media_cache,
+        status_store_path=args.status_store,
+        preflight=not args.no_preflight,
+        metrics_port=args.metrics_port,
+        metrics_path=args.metrics_json)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging(getattr(logging, args.log_level))
+
+    try:
+        config = build_config(args)
+        with open(args.template, encoding="utf-8") as file:
+            message_format = file.read().rstrip("\n")
+    except (OSError, ValueError) as e:
+        emit("error", message=str(e))
+        return EXIT_ERROR
+
+    result = {}
+    control = SendControl()
+
+    def on_completion(sent, not_sent):
+        result["sent"] = sent
+        result["not_sent"] = not_sent
+        emit("completion", sent=sent, not_sent=not_sent)
+
+    def on_error(message):
+        result["error"] = message
+        emit("error", message=message)
+
+    # Ctrl+C and SIGTERM stop the campaign cleanly; the journal keeps it open, so running the same
+    # command again resumes it
+    signal.signal(signal.SIGINT, lambda signum, frame: control.cancel())
+    signal.signal(signal.SIGTERM, lambda signum, frame: control.cancel())
+
+    try:
+        SENDERS[args.type](format=message_format,
+                           config=config,
+                           update_progress_callback=lambda current, total: emit("progress", current=current,
+                                                                                total=total),
+                           write_log_callback=lambda message: emit("log", message=message),
+                           completion_callback=on_completion,
+                           error_callback=on_error,
+                           control=control,
+                           stats_callback=lambda stats: emit("stats", **stats))
+    except Exception as e:
+        # Errors the pipeline does not report itself, e.g. a dropped network connection, are errors too
+        # and not a partial send
+        logger.exception("Campaign failed")
+        emit("error", message=str(e) or type(e).__name__)
+        return EXIT_ERROR
+
+    if control.cancelled:
+        emit("cancelled")
+        return EXIT_CANCELLED
+    if "error" in result or "sent" not in result:
+        return EXIT_ERROR
+    return EXIT_OK if result["not_sent"] == 0 else EXIT_NOT_ALL_SENT
+
+
+if __name__ == "__main__":
+    sys.exit(main())
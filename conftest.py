@@ -0,0 +1 @@
+# Lets the tests in tests/ import the application modules, which live at the top level of the repository
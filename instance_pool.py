@@ -0,0 +1,137 @@
+import bisect
+import hashlib
+import threading
+import time
+
+from send_engine import get_instance_semaphore
+from ultramsg_client import UNKNOWN_OUTCOME
+
+# Points per instance on the hash ring; more points spread recipients more evenly
+VIRTUAL_NODES = 64
+# Consecutive failed requests after which an instance is taken out of rotation
+FAILURE_THRESHOLD = 5
+FAILURE_COOLDOWN = 60.0  # seconds
+# Other instances tried for one message when its own instance fails
+MAX_FAILOVERS = 1
+
+
+def ring_hash(value):
+    return int(hashlib.md5(value.encode("utf-8")).hexdigest()[:16], 16)
+
+
+def parse_instances(value):
+    """Parse "instance_id:token, instance_id:token" from the settings into a list of (instance_id, token)."""
+    instances = []
+    for item in (value or "").replace("\n", ",").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        instance_id, _, token = item.partition(":")
+        instances.append((instance_id.strip(), token.strip()))
+    return instances
+
+
+def is_healthy(response):
+    # No response (connect errors, throttling) or no usable one (timeouts, 5xx) means the instance itself
+    # failed, while a response without "sent" is about the message, e.g. an invalid number
+    return response is not None and response is not UNKNOWN_OUTCOME
+
+
+class InstancePool:
+    """Several Ultramsg instances behind one send() call.
+
+    Recipients are mapped to instances by consistent hashing of the phone number, so a recipient keeps
+    hearing from the same sender even when instances are added or removed. Every instance keeps its own
+    rate limiter and concurrency cap; an instance that keeps failing is skipped for a cooldown period
+    and its recipients move to the next instance on the ring.
+    """
+
+    def __init__(self, clients):
+        self.clients = clients
+        self.failures = [0] * len(clients)
+        self.down_until = [0.0] * len(clients)
+        self.lock = threading.Lock()
+
+        ring = sorted((ring_hash(f"{client.instance_id}#{node}"), index)
+                      for index, client in enumerate(clients) for node in range(VIRTUAL_NODES))
+        self.ring_hashes = [point for point, _ in ring]
+        self.ring_clients = [index for _, index in ring]
+
+    def __len__(self):
+        return len(self.clients)
+
+    def candidates(self, phone):
+        # Instances in ring order starting at the phone's position, healthy ones first
+        start = bisect.bisect(self.ring_hashes, ring_hash(phone or ""))
+        seen = []
+        for offset in range(len(self.ring_clients)):
+            index = self.ring_clients[(start + offset) % len(self.ring_clients)]
+            if index not in seen:
+                seen.append(index)
+                if len(seen) == len(self.clients):
+                    break
+        now = time.monotonic()
+        return [index for index in seen if self.down_until[index] <= now] + \
+               [index for index in seen if self.down_until[index] > now]
+
+    def record(self, index, ok):
+        with self.lock:
+            if ok:
+                self.failures[index] = 0
+                return
+            self.failures[index] += 1
+            if self.failures[index] >= FAILURE_THRESHOLD:
+                self.failures[index] = 0
+                self.down_until[index] = time.monotonic() + FAILURE_COOLDOWN
+
+    def send(self, endpoint, data, phone, exclude=None):
+        response = None
+        candidates = [index for index in self.candidates(phone) if index != exclude]
+        for index in candidates[:MAX_FAILOVERS + (1 if exclude is None else 0)]:
+            client = self.clients[index]
+            with get_instance_semaphore(client.instance_id):
+                response = client.send(endpoint, data)
+            self.record(index, is_healthy(response))
+            # Only a message that never reached the instance (None) may go to the next one; after
+            # UNKNOWN_OUTCOME it may already be on its way
+            if response is not None:
+                return response
+        return response
+
+    def send_batch(self, endpoint, items):
+        """Send [(data, phone), ...] and return the responses in the same order.
+
+        Messages for the same instance go out back to back under one concurrency slot and one rate
+        limiter reservation; a message its instance turned away goes through send() on the next one.
+        """
+        groups = {}
+        for position, (data, phone) in enumerate(items):
+            groups.setdefault(self.candidates(phone)[0], []).append(position)
+
+        responses = [None] * len(items)
+        for index, positions in groups.items():
+            client = self.clients[index]
+            with get_instance_semaphore(client.instance_id):
+                results = client.send_batch(endpoint, [items[position][0] for position in positions])
+            for position, response in zip(positions, results):
+                self.record(index, is_healthy(response))
+                if response is None and MAX_FAILOVERS and len(self.clients) > 1:
+                    data, phone = items[position]
+                    response = self.send(endpoint, data, phone, exclude=index)
+                responses[position] = response
+        return responses
+
+    def upload(self, path):
+        # Hosted media URLs work from any instance, so the first healthy one uploads
+        for index in self.candidates(path)[:MAX_FAILOVERS + 1]:
+            client = self.clients[index]
+            with get_instance_semaphore(client.instance_id):
+                url = client.upload(path)
+            self.record(index, url is not None)
+            if url:
+                return url
+        return None
+
+    def update_settings(self, data):
+        for client in self.clients:
+            client.update_settings(data)
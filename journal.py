@@ -0,0 +1,121 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+JOURNAL_BATCH_SIZE = 200
+JOURNAL_FLUSH_INTERVAL = 1.0  # seconds
+
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+STATUS_INVALID = "invalid"
+
+
+def campaign_key(*parts):
+    # The same sheet sent with the same template through the same endpoint is the same campaign
+    return hashlib.sha1("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+
+def row_key(row_number, phone):
+    # Sheet row number plus phone, so an edited or re-sorted sheet does not skip the wrong recipient
+    return f"{row_number}:{phone or ''}"
+
+
+def key_row(key):
+    # Sheet row number of a row_key
+    return int(key.split(":", 1)[0])
+
+
+class SendJournal:
+    """Append-only record of per-row send results, used to resume a campaign after a crash.
+
+    Results are buffered and committed in batches, and at least every `flush_interval` seconds, also
+    while a campaign is paused; with WAL and synchronous=FULL every commit is fsync'd, so at most one
+    batch is lost when the process dies.
+    """
+
+    def __init__(self, path, batch_size=JOURNAL_BATCH_SIZE, flush_interval=JOURNAL_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+
+        # Worker processes of a partitioned campaign write to the same file
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=FULL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS campaigns (campaign TEXT PRIMARY KEY, state TEXT NOT NULL, updated REAL)")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS sends (campaign TEXT NOT NULL, row_key TEXT NOT NULL, phone TEXT, "
+            "status TEXT NOT NULL, updated REAL, PRIMARY KEY (campaign, row_key))")
+        self.connection.commit()
+
+        self.closed = threading.Event()
+        self.flusher = threading.Thread(target=self.flush_periodically, daemon=True, name="journal-flush")
+        self.flusher.start()
+
+    def flush_periodically(self):
+        while not self.closed.wait(self.flush_interval):
+            self.flush()
+
+    def start_campaign(self, campaign):
+        """Return {row key: phone} of the rows already sent when `campaign` was interrupted or left failed
+        messages behind, or an empty dict for a new run."""
+        with self.lock:
+            state = self.connection.execute("SELECT state FROM campaigns WHERE campaign = ?", (campaign,)).fetchone()
+            if state and state[0] == "running":
+                rows = self.connection.execute("SELECT row_key, phone FROM sends WHERE campaign = ? AND status = ?",
+                                               (campaign, STATUS_SENT))
+                completed = dict(rows)
+            else:
+                # A finished campaign sent again is a new run, not a resume
+                self.connection.execute("DELETE FROM sends WHERE campaign = ?", (campaign,))
+                completed = {}
+            self.connection.execute("INSERT OR REPLACE INTO campaigns (campaign, state, updated) VALUES (?, ?, ?)",
+                                    (campaign, "running", time.time()))
+            self.connection.commit()
+            return completed
+
+    def record(self, campaign, key, phone, status):
+        with self.lock:
+            self.pending.append((campaign, key, phone, status, time.time()))
+            if len(self.pending) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if self.pending:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO sends (campaign, row_key, phone, status, updated) VALUES (?, ?, ?, ?, ?)",
+                self.pending)
+            self.connection.commit()
+            self.pending = []
+        self.last_flush = time.monotonic()
+
+    def finish_campaign(self, campaign):
+        """Close `campaign` and return 0, or return the number of failed messages and keep it open.
+
+        A campaign with failed messages, e.g. after a network drop, resumes when it is sent again, so only
+        those messages are retried instead of everyone getting the message twice.
+        """
+        with self.lock:
+            self._flush()
+            failed = self.connection.execute("SELECT COUNT(*) FROM sends WHERE campaign = ? AND status = ?",
+                                             (campaign, STATUS_FAILED)).fetchone()[0]
+            if not failed:
+                self.connection.execute("UPDATE campaigns SET state = ?, updated = ? WHERE campaign = ?",
+                                        ("finished", time.time(), campaign))
+                self.connection.commit()
+            return failed
+
+    def close(self):
+        self.closed.set()
+        self.flusher.join()
+        with self.lock:
+            self._flush()
+            self.connection.close()
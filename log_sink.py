@@ -0,0 +1,94 @@
+import logging
+import sys
+import threading
+import time
+from collections import deque
+from logging.handlers import RotatingFileHandler
+
+LOG_FILE_MAX_BYTES = 5 * 1024 * 1024
+LOG_FILE_BACKUP_COUNT = 5
+# Diagnostic records let through per second, so a message logged per row cannot flood stderr
+LOG_RATE = 10.0
+LOG_BURST = 50
+
+
+class LogSink:
+    """Collects campaign log lines from any thread.
+
+    Every line goes straight to a rotating file on disk. In memory only a ring buffer of the last
+    `max_lines` lines is kept until the UI picks them up with drain(), so the size of a campaign
+    never shows up in the Tk widget or in RAM.
+    """
+
+    def __init__(self, log_path, max_lines=1000, max_bytes=LOG_FILE_MAX_BYTES, backup_count=LOG_FILE_BACKUP_COUNT):
+        self.log_path = log_path
+        self.pending = deque(maxlen=max_lines)
+
+        # A private logger, so the file handler is not shared with or duplicated by the root logger
+        self.logger = logging.Logger("campaign")
+        handler = RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        self.logger.addHandler(handler)
+
+    def write(self, message):
+        self.logger.info(message)
+        self.pending.append(message)
+
+    def start_campaign(self, title):
+        # Only marks the file; the on-screen log is cleared by the UI instead
+        self.logger.info(f"---- {title} ----")
+
+    def drain(self):
+        lines = []
+        while self.pending:
+            lines.append(self.pending.popleft())
+        return lines
+
+    def clear(self):
+        self.pending.clear()
+
+    def close(self):
+        for handler in self.logger.handlers:
+            handler.close()
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket over log records; the number of records dropped is reported on the next one let through."""
+
+    def __init__(self, rate=LOG_RATE, burst=LOG_BURST):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                self.dropped += 1
+                return False
+            self.tokens -= 1
+            if self.dropped:
+                record.msg = f"{record.msg} ({self.dropped} earlier log records suppressed)"
+                self.dropped = 0
+        return True
+
+
+def configure_logging(level=logging.WARNING, stream=None, rate=LOG_RATE, burst=LOG_BURST):
+    """Send diagnostics of every module to stderr, leveled and rate limited; safe to call more than once."""
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in root.handlers:
+        if getattr(handler, "rate_limited", False):
+            return handler
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.rate_limited = True
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    handler.addFilter(RateLimitFilter(rate, burst))
+    root.addHandler(handler)
+    return handler
@@ -2,15 +2,43 @@ import tkinter as tk
 from tkinter import ttk
 from tkinter.font import Font
 from tkinter import filedialog
+from tkinter import simpledialog
 
-import os
+import configparser
+import multiprocessing
+import queue
+import threading
+from datetime import datetime, timedelta
 
-from send_messages import send_whatsapp_message, send_whatsapp_photo, send_whatsapp_video
-from settings import save_settings_to_file, load_settings_from_file
+from campaign_config import CampaignConfig
+from log_sink import LogSink, configure_logging
+from send_engine import SendControl
+from settings import save_settings_to_file, read_settings_file, get_log_path, get_app_file, get_sheet_cache_dir, \
+    JOURNAL_FILE, MEDIA_CACHE_FILE, STATUS_STORE_FILE, CAMPAIGN_QUEUE_FILE
+
+# Sending runs on a worker thread; the UI drains its events at a fixed rate instead of redrawing per message
+UI_REFRESH_MS = 50
+MAX_EVENTS_PER_TICK = 1000
+# Only the tail of the campaign log is kept on screen, the full log is in the rotating file
+MAX_LOG_LINES = 1000
+# Delay after the window appears before the sending stack is imported in the background
+WARM_UP_DELAY_MS = 100
+
+JSON_FILETYPES = [("JSON files", "*.json")]
+RECIPIENTS_FILETYPES = [("Recipient lists", "*.csv *.tsv *.xlsx *.xlsm *.parquet"), ("All files", "*.*")]
+
+
+def load_sending_stack():
+    # The Google API client, requests and pandas are most of the start-up time, so they are imported
+    # after the window is shown (or on the first send) instead of before it
+    import send_messages
+    import campaign_queue
+    return send_messages, campaign_queue
 
 
 class MessageConstructor(tk.Frame):
-    def __init__(self, master, title, with_photo=False, with_video=False, max_blocks=6, send_action=None, *args, **kwargs):
+    def __init__(self, master, title, with_photo=False, with_video=False, max_blocks=6, send_action=None,
+                 schedule_action=None, *args, **kwargs):
         super().__init__(master, *args, **kwargs)
         self.configure(bg="#f7f7f7")
         self.master = master
@@ -22,6 +50,7 @@ class MessageConstructor(tk.Frame):
         self.is_expanded = False
         self.title = title
         self.send_action = send_action
+        self.schedule_action = schedule_action
         self.blocks = []
         self.init_ui()
 
@@ -69,6 +98,9 @@ class MessageConstructor(tk.Frame):
         self.send_button = tk.Button(self.container, text="Send", command=self.on_send)
         self.send_button.pack(side=tk.BOTTOM, fill=tk.X)
 
+        self.schedule_button = tk.Button(self.container, text="Schedule...", command=self.on_schedule)
+        self.schedule_button.pack(side=tk.BOTTOM, fill=tk.X)
+
     def toggle_view(self):
         self.master.toggle_other_sections(self)
 
@@ -113,6 +145,10 @@ class MessageConstructor(tk.Frame):
         if self.send_action:
             self.send_action()
 
+    def on_schedule(self):
+        if self.schedule_action:
+            self.schedule_action()
+
 
 class MainApplication(tk.Tk):
     def __init__(self):
@@ -122,23 +158,73 @@ class MainApplication(tk.Tk):
 
         self.minsize(800, 500)
 
-        self.settings = load_settings_from_file()
+        settings = {}
+        settings_error = None
+        try:
+            settings = read_settings_file()
+            self.load_settings(settings)
+        except (ValueError, configparser.Error) as e:
+            # A bad value in a hand-edited settings file: start with the defaults instead of not starting at all.
+            # The settings window still shows the saved values, so the bad one can be corrected there
+            self.load_settings({})
+            self.settings = settings
+            settings_error = f"Could not load the settings, using the defaults: {e}"
 
         settings_button = tk.Button(self, text="Settings", command=self.open_settings, bg="#0078D7", fg="white", bd=0)
         settings_button.pack(pady=10, padx=10, fill=tk.X)
 
         self.photo_frame = MessageConstructor(self, "Message with Photo", with_photo=True,
-                                              send_action=self.send_photo)
+                                              send_action=self.send_photo,
+                                              schedule_action=lambda: self.schedule_campaign("image", self.photo_frame))
         self.photo_frame.pack(pady=10, padx=10, fill=tk.X)
 
         self.no_photo_frame = MessageConstructor(self, "Message without Photo", with_photo=False, max_blocks=5,
-                                                 send_action=self.send_text)
+                                                 send_action=self.send_text,
+                                                 schedule_action=lambda: self.schedule_campaign("chat",
+                                                                                                self.no_photo_frame))
         self.no_photo_frame.pack(pady=10, padx=10, fill=tk.X)
 
         self.vide_frame = MessageConstructor(self, "Message with video", with_video=True, max_blocks=5,
-                                             send_action=self.send_video)
+                                             send_action=self.send_video,
+                                             schedule_action=lambda: self.schedule_campaign("video", self.vide_frame))
         self.vide_frame.pack(pady=10, padx=10, fill=tk.X)
+
+        self.events = queue.Queue()
+        if settings_error:
+            # Shown by process_events once the window is up
+            self.events.put(("error", settings_error))
+        self.log_sink = LogSink(get_log_path(), max_lines=MAX_LOG_LINES)
+        self.send_thread = None
+        self.send_control = None
+
         self.setup_ui()
+        self.after(UI_REFRESH_MS, self.process_events)
+
+        self.campaign_queue = None
+        self.scheduler = None
+        self.scheduler_lock = threading.Lock()
+        self.after(WARM_UP_DELAY_MS, self.start_warm_up)
+
+    def start_warm_up(self):
+        threading.Thread(target=self.warm_up, daemon=True, name="warm-up").start()
+
+    def warm_up(self):
+        # Runs on its own thread: imports the sending stack, then starts the scheduler
+        try:
+            self.ensure_scheduler()
+        except Exception as e:
+            self.events.put(("error", f"Could not load the sending modules: {e}"))
+
+    def ensure_scheduler(self):
+        # Scheduled campaigns run in the background while the window is open
+        with self.scheduler_lock:
+            if self.scheduler is None:
+                _, campaign_queue = load_sending_stack()
+                self.campaign_queue = campaign_queue.CampaignQueue(get_app_file(CAMPAIGN_QUEUE_FILE))
+                self.scheduler = campaign_queue.CampaignScheduler(
+                    self.campaign_queue, on_log=lambda job_id, message: self.write_log(f"[job {job_id}] {message}"))
+                self.scheduler.start()
+        return self.scheduler
 
     def setup_ui(self):
         # Custom style for Progressbar
@@ -153,6 +239,17 @@ class MainApplication(tk.Tk):
         self.progress_bar = ttk.Progressbar(self, orient="horizontal", mode="determinate", length=300)
         self.progress_bar.pack(fill=tk.X, padx=10, pady=5)
 
+        controls_frame = tk.Frame(self, bg="#f0f0f0")
+        controls_frame.pack(padx=10, pady=5)
+
+        self.pause_button = tk.Button(controls_frame, text="Pause", command=self.toggle_pause, state="disabled",
+                                      width=10)
+        self.pause_button.pack(side=tk.LEFT, padx=5)
+
+        self.cancel_button = tk.Button(controls_frame, text="Cancel", command=self.cancel_sending, state="disabled",
+                                       width=10)
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
+
         logs_label = tk.Label(self, text="Logs:", bg="#f0f0f0", font=("Arial", 12, "bold"))
         logs_label.pack(padx=10, pady=(10, 0))
 
@@ -166,20 +263,32 @@ class MainApplication(tk.Tk):
         self.settings_window.configure(bg="#f7f7f7")
 
         # Simplified entry fields for settings
-        self.ultramsg_token_entry = self.create_setting_entry("ULTRAMSG_TOKEN", os.environ.get('ULTRAMSG_TOKEN', ''),
-                                                              False, False)
+        self.ultramsg_token_entry = self.create_setting_entry("ULTRAMSG_TOKEN",
+                                                              self.settings.get('ultramsg_token', ''), False, False)
         self.ultramsg_instance_id_entry = self.create_setting_entry("ULTRAMSG_INSTANCE_ID",
-                                                                    os.environ.get('ULTRAMSG_INSTANCE_ID', ''), False,
-                                                                    False)
-        self.spreadsheet_id_entry = self.create_setting_entry("SPREADSHEET_ID", os.environ.get('SPREADSHEET_ID', ''),
+                                                                    self.settings.get('ultramsg_instance_id', ''),
+                                                                    False, False)
+        self.ultramsg_instances_entry = self.create_setting_entry("ULTRAMSG_INSTANCES (extra, id:token, ...)",
+                                                                  self.settings.get('ultramsg_instances', ''), False,
+                                                                  False)
+        self.spreadsheet_id_entry = self.create_setting_entry("SPREADSHEET_ID", self.settings.get('spreadsheet_id', ''),
                                                               False, False)
         self.service_account_file_entry = self.create_setting_entry("SERVICE_ACCOUNT_FILE",
-                                                                    os.environ.get('SERVICE_ACCOUNT_FILE', ''), True,
+                                                                    self.settings.get('service_account_file', ''), True,
                                                                     False)
         self.message_delay_entry = self.create_setting_entry("MESSAGE_DELAY (in seconds)",
-                                                             os.environ.get('MESSAGE_DELAY', '1'), False, True)
+                                                             self.settings.get('message_delay', '1'), False, True)
         self.sheet_name_entry = self.create_setting_entry("SHEET_NUMBER (just number)",
-                                                          os.environ.get('SHEET_NUMBER', '1'), False, True)
+                                                          self.settings.get('sheet_number', '1'), False, True)
+        self.concurrency_entry = self.create_setting_entry("CONCURRENCY (messages in flight)",
+                                                           self.settings.get('concurrency', '8'), False, True)
+        self.country_code_entry = self.create_setting_entry("DEFAULT_COUNTRY_CODE (for numbers without +)",
+                                                            self.settings.get('default_country_code', ''), False, True)
+        self.recipients_file_entry = self.create_setting_entry("RECIPIENTS_FILE (instead of the sheet)",
+                                                               self.settings.get('recipients_file', ''), True, False,
+                                                               filetypes=RECIPIENTS_FILETYPES)
+        self.write_back_entry = self.create_setting_entry("WRITE_BACK (yes/no, results into the sheet)",
+                                                          self.settings.get('write_back', 'no'), False, False)
 
         # Save button
         save_button = tk.Button(self.settings_window, text="Save", command=self.save_settings, bg="#0078D7", fg="white",
@@ -206,9 +315,10 @@ class MainApplication(tk.Tk):
         x = x_main + (width_main // 2) - (width // 2)
         y = y_main + (height_main // 2) - (height // 2)
 
-        window.geometry(f'{600}x{300}+{x}+{y}')
+        window.geometry(f'{600}x{500}+{x}+{y}')
 
-    def create_setting_entry(self, label_text, default_value, file_picker=False, only_digits=False):
+    def create_setting_entry(self, label_text, default_value, file_picker=False, only_digits=False,
+                             filetypes=JSON_FILETYPES):
         frame = tk.Frame(self.settings_window, bg="#f7f7f7")
         frame.pack(padx=10, pady=5, fill=tk.X)
 
@@ -230,8 +340,8 @@ class MainApplication(tk.Tk):
         entry.bind("<Control-x>", lambda e: self.cut_to_clipboard(entry))
 
         if file_picker:
-            button = tk.Button(frame, text="Browse", command=lambda: self.browse_file(entry), bg="#0078D7", fg="white",
-                               bd=0)
+            button = tk.Button(frame, text="Browse", command=lambda: self.browse_file(entry, filetypes), bg="#0078D7",
+                               fg="white", bd=0)
             button.pack(side=tk.RIGHT, padx=5)
 
         return entry
@@ -253,8 +363,8 @@ class MainApplication(tk.Tk):
             pass  # Handle case where there's nothing to paste
         return "break"  # Prevent further processing of the event
 
-    def browse_file(self, entry):
-        filename = filedialog.askopenfilename(title="Select file", filetypes=[("JSON files", "*.json")])
+    def browse_file(self, entry, filetypes=JSON_FILETYPES):
+        filename = filedialog.askopenfilename(title="Select file", filetypes=filetypes)
         if filename:
             entry.delete(0, tk.END)
             entry.insert(0, filename)
@@ -263,28 +373,35 @@ class MainApplication(tk.Tk):
         # Retrieve values from entry fields
         ultramsg_token = self.ultramsg_token_entry.get()
         ultramsg_instance_id = self.ultramsg_instance_id_entry.get()
+        ultramsg_instances = self.ultramsg_instances_entry.get()
         spreadsheet_id = self.spreadsheet_id_entry.get()
         service_account_file = self.service_account_file_entry.get()
         sheet_number = self.sheet_name_entry.get()
         message_delay = self.message_delay_entry.get()
-
-        # Update environment variables or application settings
-        os.environ['ULTRAMSG_TOKEN'] = ultramsg_token
-        os.environ['ULTRAMSG_INSTANCE_ID'] = ultramsg_instance_id
-        os.environ['SPREADSHEET_ID'] = spreadsheet_id
-        os.environ['SERVICE_ACCOUNT_FILE'] = service_account_file
-        os.environ['MESSAGE_DELAY'] = message_delay
-        os.environ['SHEET_NUMBER'] = sheet_number
+        concurrency = self.concurrency_entry.get()
+        default_country_code = self.country_code_entry.get()
+        recipients_file = self.recipients_file_entry.get()
+        write_back = self.write_back_entry.get()
 
         settings = {
             'ULTRAMSG_TOKEN': ultramsg_token,
             'ULTRAMSG_INSTANCE_ID': ultramsg_instance_id,
+            'ULTRAMSG_INSTANCES': ultramsg_instances,
             'SPREADSHEET_ID': spreadsheet_id,
             'SERVICE_ACCOUNT_FILE': service_account_file,
             'MESSAGE_DELAY': message_delay,
-            'SHEET_NUMBER': sheet_number
+            'SHEET_NUMBER': sheet_number,
+            'CONCURRENCY': concurrency,
+            'DEFAULT_COUNTRY_CODE': default_country_code,
+            'RECIPIENTS_FILE': recipients_file,
+            'WRITE_BACK': write_back
         }
 
+        try:
+            self.load_settings({key.lower(): value for key, value in settings.items()})
+        except ValueError as e:
+            self.show_error_popup(str(e))
+            return
         save_settings_to_file(settings)
 
         # Optionally, save these settings to a configuration file or other persistent storage
@@ -296,19 +413,111 @@ class MainApplication(tk.Tk):
         # Calculate the percentage completion
         progress = (current / total) * 100
         self.progress_bar["value"] = progress
-        self.update_idletasks()  # Update the UI
 
     def write_log(self, message):
+        self.log_sink.write(message)
+
+    def show_log_lines(self, lines):
+        # Keep only the last MAX_LOG_LINES lines in the widget
+        lines = lines[-MAX_LOG_LINES:]
         self.log_text.configure(state="normal")
-        self.log_text.insert(tk.END, message + "\n")
+        self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+        line_count = int(self.log_text.index("end-1c").split(".")[0]) - 1
+        if line_count > MAX_LOG_LINES:
+            self.log_text.delete("1.0", f"{line_count - MAX_LOG_LINES + 1}.0")
         self.log_text.configure(state="disabled")
         self.log_text.yview(tk.END)
 
     def clear_logs(self):
+        self.log_sink.clear()
         self.log_text.configure(state="normal")
         self.log_text.delete(1.0, tk.END)
         self.log_text.configure(state="disabled")
 
+    def start_sending(self, send_function, message_format, config):
+        if self.send_thread and self.send_thread.is_alive():
+            self.show_error_popup("Sending is already in progress")
+            return
+
+        self.clear_logs()
+        self.log_sink.start_campaign(f"{send_function.__name__} started")
+        self.show_log_lines([f"Full log: {self.log_sink.log_path}"])
+        self.progress_bar["value"] = 0
+        self.send_control = SendControl()
+        self.pause_button.configure(text="Pause", state="normal")
+        self.cancel_button.configure(state="normal")
+
+        self.send_thread = threading.Thread(target=self.run_sending,
+                                            args=(send_function, message_format, config, self.send_control),
+                                            daemon=True)
+        self.send_thread.start()
+
+    def run_sending(self, send_function, message_format, config, control):
+        # Runs on the worker thread: never touch Tk here, only post events for process_events
+        try:
+            send_function(format=message_format,
+                          update_progress_callback=lambda current, total: self.events.put(("progress", current, total)),
+                          write_log_callback=self.write_log,
+                          completion_callback=lambda sent, not_sent: self.events.put(("completion", sent, not_sent)),
+                          error_callback=lambda message: self.events.put(("error", message)),
+                          config=config,
+                          control=control)
+        except Exception as e:
+            self.events.put(("error", f"Sending failed: {e}"))
+        finally:
+            self.events.put(("finished",))
+
+    def process_events(self):
+        # Log lines are written to the sink by the worker; drain them before events so popups come last
+        log_lines = self.log_sink.drain()
+        progress = None
+        popups = []
+        finished = False
+
+        for _ in range(MAX_EVENTS_PER_TICK):
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+
+            if event[0] == "progress":
+                # Only the latest progress value matters for this frame
+                progress = event[1:]
+            elif event[0] == "completion":
+                popups.append((self.show_completion_popup, event[1:]))
+            elif event[0] == "error":
+                popups.append((self.show_error_popup, event[1:]))
+            elif event[0] == "finished":
+                finished = True
+
+        if log_lines:
+            self.show_log_lines(log_lines)
+        if progress:
+            self.update_progress(*progress)
+        if finished:
+            self.pause_button.configure(text="Pause", state="disabled")
+            self.cancel_button.configure(state="disabled")
+        for popup, args in popups:
+            popup(*args)
+
+        self.after(UI_REFRESH_MS, self.process_events)
+
+    def toggle_pause(self):
+        if not self.send_control:
+            return
+        if self.send_control.paused:
+            self.send_control.resume()
+            self.pause_button.configure(text="Pause")
+        else:
+            self.send_control.pause()
+            self.pause_button.configure(text="Resume")
+
+    def cancel_sending(self):
+        if self.send_control:
+            self.send_control.cancel()
+            self.pause_button.configure(state="disabled")
+            self.cancel_button.configure(state="disabled")
+
     def toggle_other_sections(self, current_section):
         if current_section.is_expanded:
             current_section.container.pack_forget()
@@ -321,94 +530,61 @@ class MainApplication(tk.Tk):
             current_section.container.pack(fill=tk.BOTH, expand=True)
             current_section.is_expanded = True
 
-    def send_photo(self):
-        self.clear_logs()
+    def message_format(self, frame):
         message_content = []
-        for block in self.photo_frame.blocks:
+        for block in frame.blocks:
             if block["type"] == "Custom text":
-                # Retrieve text from the Text widget
-                text = block["entry"].get("1.0", "end-1c")
-                # Replace occurrences of '\n' with actual newline characters
-                # processed_text = text.replace("\\n", "\n")
-                message_content.append("{{" + text + "}}")
+                # Custom text goes into the template as is, so it may hold {{column}} placeholders
+                message_content.append(block["entry"].get("1.0", "end-1c"))
             else:
                 message_content.append("{{" + block["type"] + "}}")
+        return "".join(message_content)
 
-        config = {
-            "ultramsg_token": os.environ['ULTRAMSG_TOKEN'],
-            "ultramsg_instance_id": os.environ['ULTRAMSG_INSTANCE_ID'],
-            "service_account_file": os.environ['SERVICE_ACCOUNT_FILE'],
-            "spreadsheet_id": os.environ['SPREADSHEET_ID'],
-            "message_delay": os.environ['MESSAGE_DELAY'],
-            "sheet_number": os.environ['SHEET_NUMBER']
-        }
-        # print(config)
-        send_whatsapp_photo(format=" ".join(message_content),
-                            update_progress_callback=self.update_progress,
-                            write_log_callback=self.write_log,
-                            completion_callback=self.show_completion_popup,
-                            error_callback=self.show_error_popup,
-                            config=config
-                            )
+    def load_settings(self, settings):
+        # Parsed once here and on every save; each campaign gets this immutable config
+        self.settings = settings
+        self.campaign_config = CampaignConfig.from_dict(settings).replace(
+            journal_path=get_app_file(JOURNAL_FILE), sheet_cache_dir=get_sheet_cache_dir(),
+            media_cache_path=get_app_file(MEDIA_CACHE_FILE), status_store_path=get_app_file(STATUS_STORE_FILE))
 
-    def send_video(self):
-        self.clear_logs()
-        message_content = []
-        for block in self.vide_frame.blocks:
-            if block["type"] == "Custom text":
-                # Retrieve text from the Text widget
-                text = block["entry"].get("1.0", "end-1c")
-                # Replace occurrences of '\n' with actual newline characters
-                # processed_text = text.replace("\\n", "\n")
-                message_content.append("{{" + text + "}}")
-            else:
-                message_content.append("{{" + block["type"] + "}}")
+    def sending_config(self):
+        return self.campaign_config
 
-        config = {
-            "ultramsg_token": os.environ['ULTRAMSG_TOKEN'],
-            "ultramsg_instance_id": os.environ['ULTRAMSG_INSTANCE_ID'],
-            "service_account_file": os.environ['SERVICE_ACCOUNT_FILE'],
-            "spreadsheet_id": os.environ['SPREADSHEET_ID'],
-            "message_delay": os.environ['MESSAGE_DELAY'],
-            "sheet_number": os.environ['SHEET_NUMBER']
-        }
-        # print(config)
-        send_whatsapp_video(format=" ".join(message_content),
-                            update_progress_callback=self.update_progress,
-                            write_log_callback=self.write_log,
-                            completion_callback=self.show_completion_popup,
-                            error_callback=self.show_error_popup,
-                            config=config
-                            )
+    def send_photo(self):
+        send_messages, _ = load_sending_stack()
+        self.start_sending(send_messages.send_whatsapp_photo, self.message_format(self.photo_frame),
+                           self.sending_config())
+
+    def send_video(self):
+        send_messages, _ = load_sending_stack()
+        self.start_sending(send_messages.send_whatsapp_video, self.message_format(self.vide_frame),
+                           self.sending_config())
 
     def send_text(self):
-        self.clear_logs()
-        message_content = []
-        for block in self.no_photo_frame.blocks:
-            if block["type"] == "Custom text":
-                # Retrieve text from the Text widget
-                text = block["entry"].get("1.0", "end-1c")
-                # Replace occurrences of '\n' with actual newline characters
-                # processed_text = text.replace("\\n", "\n")
-                message_content.append("{{" + text + "}}")
-            else:
-                message_content.append("{{" + block["type"] + "}}")
-        config = {
-            "ultramsg_token": os.environ['ULTRAMSG_TOKEN'],
-            "ultramsg_instance_id": os.environ['ULTRAMSG_INSTANCE_ID'],
-            "service_account_file": os.environ['SERVICE_ACCOUNT_FILE'],
-            "spreadsheet_id": os.environ['SPREADSHEET_ID'],
-            "message_delay": os.environ['MESSAGE_DELAY'],
-            "sheet_number": os.environ['SHEET_NUMBER']
-        }
-        # print(config)
-        send_whatsapp_message(format=" ".join(message_content),
-                              update_progress_callback=self.update_progress,
-                              write_log_callback=self.write_log,
-                              completion_callback=self.show_completion_popup,
-                              error_callback=self.show_error_popup,
-                              config=config
-                              )
+        send_messages, _ = load_sending_stack()
+        self.start_sending(send_messages.send_whatsapp_message, self.message_format(self.no_photo_frame),
+                           self.sending_config())
+
+    def schedule_campaign(self, kind, frame):
+        now = datetime.now()
+        start = simpledialog.askstring("Schedule", "Window start (YYYY-MM-DD HH:MM):", parent=self,
+                                       initialvalue=now.strftime("%Y-%m-%d %H:%M"))
+        if not start:
+            return
+        end = simpledialog.askstring("Schedule", "Window end (YYYY-MM-DD HH:MM):", parent=self,
+                                     initialvalue=(now + timedelta(hours=1)).strftime("%Y-%m-%d %H:%M"))
+        if not end:
+            return
+
+        _, campaign_queue = load_sending_stack()
+        try:
+            self.ensure_scheduler()
+            job_id = self.campaign_queue.add(kind, self.message_format(frame), self.sending_config(),
+                                             campaign_queue.parse_time(start), campaign_queue.parse_time(end))
+        except (KeyError, ValueError) as e:
+            self.show_error_popup(f"Could not schedule the campaign: {e}")
+            return
+        self.write_log(f"[job {job_id}] Scheduled for {start} - {end}")
 
     def show_completion_popup(self, sent_count, not_sent_count):
         popup = self.create_centered_popup("Sending Completed")
@@ -451,5 +627,8 @@ class MainApplication(tk.Tk):
 
 
 if __name__ == "__main__":
+    # Partitioned campaigns start worker processes, which a frozen executable has to be able to run
+    multiprocessing.freeze_support()
+    configure_logging()
     app = MainApplication()
     app.mainloop()
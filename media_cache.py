@@ -0,0 +1,96 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+HASH_CHUNK_SIZE = 1024 * 1024
+MEDIA_CACHE_MAX_ENTRIES = 1000
+MEDIA_CACHE_MAX_AGE = 30 * 24 * 3600  # seconds a hosted URL is trusted
+
+
+def is_local_path(value):
+    return not value.startswith(("http://", "https://")) and os.path.isfile(os.path.expanduser(value))
+
+
+def file_digest(path):
+    # Hashed in chunks, so a large video never has to be read into memory at once
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MediaCache:
+    """Hosted URLs of uploaded local files, keyed by the SHA-256 of the file content.
+
+    The same file used by thousands of rows, or renamed, or sent again next week, is uploaded once.
+    Entries older than `max_age` are dropped, and beyond `max_entries` the least recently used go first.
+    """
+
+    def __init__(self, path, max_entries=MEDIA_CACHE_MAX_ENTRIES, max_age=MEDIA_CACHE_MAX_AGE):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        # Hashing is the slow part of a lookup, so it is done once per file version and process
+        self.digests = {}
+
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS media (digest TEXT PRIMARY KEY, url TEXT NOT NULL, created REAL, "
+            "last_used REAL)")
+        self.connection.commit()
+        self.evict()
+
+    def digest(self, path):
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        if key not in self.digests:
+            self.digests[key] = file_digest(path)
+        return self.digests[key]
+
+    def get(self, digest):
+        with self.lock:
+            row = self.connection.execute("SELECT url, created FROM media WHERE digest = ?", (digest,)).fetchone()
+            if not row or row[1] < time.time() - self.max_age:
+                return None
+            self.connection.execute("UPDATE media SET last_used = ? WHERE digest = ?", (time.time(), digest))
+            self.connection.commit()
+            return row[0]
+
+    def put(self, digest, url):
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO media (digest, url, created, last_used) VALUES (?, ?, ?, ?)",
+                (digest, url, now, now))
+            self.connection.commit()
+
+    def evict(self):
+        with self.lock:
+            self.connection.execute("DELETE FROM media WHERE created < ?", (time.time() - self.max_age,))
+            self.connection.execute(
+                "DELETE FROM media WHERE digest NOT IN (SELECT digest FROM media ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,))
+            self.connection.commit()
+
+    def resolve(self, value, upload):
+        """Return `value` itself for URLs, otherwise the hosted URL of the local file, uploading it if needed.
+
+        Returns None when the file could not be uploaded.
+        """
+        if not is_local_path(value):
+            return value
+        path = os.path.expanduser(value)
+        digest = self.digest(path)
+        url = self.get(digest)
+        if url is None:
+            url = upload(path)
+            if url:
+                self.put(digest, url)
+        return url
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,241 @@
+"""Counters, histograms and in-flight gauges for the stages of a campaign.
+
+    with stage("http_send"):
+        response = session.post(...)
+
+records the duration in `stage_seconds{stage="http_send"}` and counts the stage as in flight while it
+runs. METRICS can be exported as Prometheus text (serve_metrics) or written to a JSON file.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SHEET_READ = "sheet_read"
+ROW_PARSE = "row_parse"
+PREFLIGHT = "preflight"
+RENDER = "render"
+HTTP_SEND = "http_send"
+UI_CALLBACK = "ui_callback"
+
+# Seconds; wide enough for a 10 µs render as well as a 30 s request
+DEFAULT_BUCKETS = (0.00001, 0.0001, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def label_text(labels):
+    return ",".join(f'{name}="{value}"' for name, value in labels)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+    def as_json(self):
+        return self.value
+
+    def merge(self, value):
+        self.inc(value)
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def merge(self, value):
+        # A gauge is the state of its own process; the in-flight count of a finished worker means nothing here
+        pass
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            yield f"{name}_bucket", labels + (("le", "+Inf" if bound == float("inf") else repr(bound)),), cumulative
+        yield f"{name}_sum", labels, self.sum
+        yield f"{name}_count", labels, self.count
+
+    def as_json(self):
+        return {"count": self.count, "sum": round(self.sum, 6),
+                "mean": round(self.sum / self.count, 6) if self.count else None,
+                "buckets": dict(zip([repr(bound) for bound in self.buckets] + ["+Inf"], self.counts))}
+
+    def merge(self, value):
+        with self.lock:
+            for index, bound in enumerate([repr(bound) for bound in self.buckets] + ["+Inf"]):
+                self.counts[index] += value["buckets"].get(bound, 0)
+            self.sum += value["sum"]
+            self.count += value["count"]
+
+
+class Metrics:
+    """Named metric families; one series per distinct set of labels."""
+
+    def __init__(self):
+        self.families = {}
+        self.lock = threading.Lock()
+
+    def get(self, metric_class, name, help_text, labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            family = self.families.setdefault(name, {"type": metric_class.kind, "help": help_text, "series": {}})
+            series = family["series"].get(key)
+            if series is None:
+                series = family["series"][key] = metric_class()
+            return series
+
+    def counter(self, name, help_text="", **labels):
+        return self.get(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text="", **labels):
+        return self.get(Gauge, name, help_text, labels)
+
+    def histogram(self, name, help_text="", **labels):
+        return self.get(Histogram, name, help_text, labels)
+
+    def reset(self):
+        with self.lock:
+            self.families = {}
+
+    def to_prometheus(self):
+        lines = []
+        with self.lock:
+            families = [(name, dict(family, series=dict(family["series"]))) for name, family in self.families.items()]
+        for name, family in families:
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['type']}")
+            for labels, series in family["series"].items():
+                for sample, sample_labels, value in series.samples(name, labels):
+                    text = label_text(sample_labels)
+                    lines.append(f"{sample}{{{text}}} {value}" if text else f"{sample} {value}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self):
+        with self.lock:
+            families = list(self.families.items())
+        return {name: [{"labels": dict(labels), "value": series.as_json()}
+                       for labels, series in list(family["series"].items())]
+                for name, family in families}
+
+    def snapshot(self):
+        # Like to_json, with the type and help of each family, so another process can merge it
+        with self.lock:
+            families = list(self.families.items())
+        return {name: {"type": family["type"], "help": family["help"],
+                       "series": [(dict(labels), series.as_json())
+                                  for labels, series in list(family["series"].items())]}
+                for name, family in families}
+
+    def merge(self, snapshot):
+        """Add the snapshot() of another registry, e.g. of a worker process, to this one."""
+        kinds = {"counter": Counter, "gauge": Gauge, "histogram": Histogram}
+        for name, family in snapshot.items():
+            for labels, value in family["series"]:
+                self.get(kinds[family["type"]], name, family["help"], labels).merge(value)
+
+    def write_json(self, path):
+        # Written next to the target and renamed, so a reader never sees half a file
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump(self.to_json(), file, indent=2)
+        os.replace(temporary_path, path)
+
+
+METRICS = Metrics()
+
+
+@contextmanager
+def stage(name, metrics=METRICS):
+    in_flight = metrics.gauge("stage_in_flight", "Stage calls running right now", stage=name)
+    in_flight.inc()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.histogram("stage_seconds", "Time spent per stage call", stage=name).observe(
+            time.perf_counter() - started)
+        in_flight.dec()
+
+
+def count(name, help_text="", amount=1, metrics=METRICS, **labels):
+    metrics.counter(name, help_text, **labels).inc(amount)
+
+
+def timed_callback(callback, metrics=METRICS):
+    # Wraps a UI callback so the time the UI side takes is recorded as its own stage
+    if callback is None:
+        return None
+
+    def timed(*args, **kwargs):
+        with stage(UI_CALLBACK, metrics):
+            return callback(*args, **kwargs)
+
+    return timed
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    metrics = METRICS
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] == "/metrics.json":
+            payload = json.dumps(self.metrics.to_json()).encode("utf-8")
+            content_type = "application/json"
+        else:
+            payload = self.metrics.to_prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+def serve_metrics(port, host="127.0.0.1", metrics=METRICS):
+    """Serve /metrics (Prometheus text) and /metrics.json on a daemon thread; one server per port."""
+    with _servers_lock:
+        server = _servers.get(port)
+        if server is None:
+            handler = type("Handler", (MetricsHandler,), {"metrics": metrics})
+            server = ThreadingHTTPServer((host, port), handler)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, daemon=True, name="metrics").start()
+            _servers[port] = server
+        return server
@@ -0,0 +1,165 @@
+"""Send one campaign from several worker processes.
+
+Rendering requests, parsing responses, logging and bookkeeping all hold the GIL, so a very large
+campaign runs out of CPU in one process long before Ultramsg runs out of capacity. run_partitions
+splits the prepared rows into one partition per process. Every worker has its own HTTP pools and an
+equal share of the concurrency and rate limits, and reports back through a queue, so the caller
+still sees one progress stream in row order per partition and one final count.
+"""
+import logging
+import math
+import multiprocessing
+import queue
+import threading
+
+from log_sink import configure_logging
+from metrics import METRICS
+from pipeline import MESSAGE_TYPES, send_entries, pool_from_config, open_journal, open_status_store
+from rate_limiter import DEFAULT_RATE, MAX_RATE
+from send_engine import SendControl, SendStats, DEFAULT_CONCURRENCY, DEFAULT_BATCH_SIZE, DEFAULT_FLUSH_INTERVAL
+
+# Results go to the parent in batches instead of one queue put per message
+EVENT_BATCH_SIZE = 200
+EVENT_FLUSH_INTERVAL = 0.1  # seconds, also how often a worker checks for pause and cancel
+
+logger = logging.getLogger(__name__)
+
+
+def partition(entries, count):
+    # Interleaved, so every worker gets a share of each part of the sheet and progress advances evenly
+    return [entries[index::count] for index in range(count)]
+
+
+def worker_config(config, processes):
+    return config.replace(
+        processes=1,
+        concurrency=max(1, math.ceil((config.concurrency or DEFAULT_CONCURRENCY) / processes)),
+        # Rate limits are per instance and every worker has its own client per instance
+        rate_limit=(config.rate_limit or DEFAULT_RATE) / processes,
+        max_rate_limit=(config.max_rate_limit or MAX_RATE) / processes,
+        global_rate_limit=config.global_rate_limit / processes if config.global_rate_limit else None,
+        # Served and written by the parent, which merges the metrics of its workers
+        metrics_port=None,
+        metrics_path=None)
+
+
+def send_partition(index, endpoint, entries, columns, campaign, config, events, cancel, pause, log_level):
+    # Runs in the worker process
+    configure_logging(log_level)
+    control = SendControl()
+    buffer = []
+    buffer_lock = threading.Lock()
+    stopped = threading.Event()
+
+    def flush():
+        with buffer_lock:
+            if buffer:
+                events.put(("messages", list(buffer)))
+                buffer.clear()
+
+    def follow_parent():
+        # SendControl only works within a process; mirror the parent's pause and cancel from the shared events
+        while not stopped.wait(EVENT_FLUSH_INTERVAL):
+            if cancel.is_set():
+                control.cancel()
+            elif pause.is_set() != control.paused:
+                control.pause() if pause.is_set() else control.resume()
+            flush()
+
+    def on_message(status, job):
+        with buffer_lock:
+            buffer.append((status, job["key"], job["phone"], job["error"], job.get("message_id")))
+            full = len(buffer) >= EVENT_BATCH_SIZE
+        if full:
+            flush()
+
+    follower = threading.Thread(target=follow_parent, daemon=True)
+    follower.start()
+    journal = open_journal(config)
+    status_store = open_status_store(config)
+    stats = error = None
+    try:
+        stats = send_entries(MESSAGE_TYPES[endpoint], entries, columns, campaign, config, pool_from_config(config),
+                             journal=journal, status_store=status_store, control=control,
+                             remaining=lambda: len(entries), on_message=on_message).as_dict()
+    except Exception as e:
+        logger.exception("Partition %s failed", index + 1)
+        error = f"Partition {index + 1} failed: {e}"
+    finally:
+        stopped.set()
+        follower.join()
+        flush()
+        if journal:
+            journal.close()
+        if status_store:
+            status_store.close()
+        events.put(("done", index, stats, METRICS.snapshot(), error))
+
+
+def run_partitions(message_type, entries, columns, campaign, config, control=None, on_message=None,
+                   write_log_callback=None):
+    """Send `entries` ((key, phone, row, text), see pipeline.send_entries) from config.processes processes.
+
+    `on_message(status, job)` gets every result in the calling thread, with `job` holding the key, phone,
+    error and message ID of the message. Returns the merged SendStats.
+    """
+    stats = SendStats(config.batch_size or DEFAULT_BATCH_SIZE, config.flush_interval or DEFAULT_FLUSH_INTERVAL)
+    processes = min(config.processes, len(entries))
+    if not processes:
+        return stats
+
+    # spawn rather than fork: the parent has running threads (sheet reader, UI, scheduler) that a fork would copy
+    # in whatever state they are in
+    context = multiprocessing.get_context("spawn")
+    events = context.Queue()
+    cancel = context.Event()
+    pause = context.Event()
+    config = worker_config(config, processes)
+    workers = [context.Process(target=send_partition, name=f"campaign-partition-{index + 1}", daemon=True,
+                               args=(index, message_type.endpoint, part, columns, campaign, config, events, cancel,
+                                     pause, logging.getLogger().level))
+               for index, part in enumerate(partition(entries, processes))]
+    for worker in workers:
+        worker.start()
+
+    running = set(range(processes))
+    # A worker that is gone without a "done" event crashed; checked on a second empty poll, so an event
+    # still on its way through the queue is not mistaken for a crash
+    suspected = set()
+    while running:
+        if control:
+            if control.cancelled:
+                cancel.set()
+            elif control.paused != pause.is_set():
+                pause.set() if control.paused else pause.clear()
+        try:
+            event = events.get(timeout=EVENT_FLUSH_INTERVAL)
+        except queue.Empty:
+            for index in list(running):
+                if workers[index].is_alive():
+                    continue
+                if index in suspected:
+                    running.discard(index)
+                    if write_log_callback:
+                        write_log_callback(f"Partition {index + 1} stopped unexpectedly "
+                                           f"(exit code {workers[index].exitcode})")
+                else:
+                    suspected.add(index)
+            continue
+
+        if event[0] == "messages":
+            if on_message:
+                for status, key, phone, error, message_id in event[1]:
+                    on_message(status, {"key": key, "phone": phone, "error": error, "message_id": message_id})
+        elif event[0] == "done":
+            _, index, worker_stats, snapshot, error = event
+            running.discard(index)
+            if worker_stats:
+                stats.merge(worker_stats)
+            METRICS.merge(snapshot)
+            if error and write_log_callback:
+                write_log_callback(error)
+
+    for worker in workers:
+        worker.join()
+    return stats
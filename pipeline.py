@@ -0,0 +1,381 @@
+import logging
+from functools import partial
+
+from campaign_config import CampaignConfig
+from journal import SendJournal, campaign_key, row_key, key_row, STATUS_SENT, STATUS_FAILED, STATUS_INVALID
+from instance_pool import InstancePool, parse_instances
+from media_cache import MediaCache
+from metrics import METRICS, stage, count, timed_callback, serve_metrics, PREFLIGHT, RENDER
+from preflight import preflight
+from send_engine import dispatch_in_order, SendStats, WindowPacer, DEFAULT_CONCURRENCY, MAX_INSTANCE_CONCURRENCY, \
+    DEFAULT_BATCH_SIZE, DEFAULT_FLUSH_INTERVAL
+from status_store import StatusStore, reference_id, campaign_id
+from sources import source_from_config, BASE_COLUMNS
+from templates import compile_template, template_columns
+from rate_limiter import get_rate_budget, DEFAULT_RATE, MAX_RATE, DEFAULT_MAX_ATTEMPTS
+from ultramsg_client import get_client, API_URL, DEFAULT_POOL_SIZE, DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+
+class MessageType:
+    """How one kind of Ultramsg message is built from a sheet row.
+
+    `text_field` receives the rendered template, `columns` maps API fields to sheet columns that must be
+    filled and `optional_columns` those that are sent only when present. Values of `media_fields` may be
+    local file paths, which are replaced by their hosted URL through `resolve_media`.
+    """
+
+    def __init__(self, endpoint, text_field=None, text_required=False, columns=None, optional_columns=None,
+                 media_fields=()):
+        self.endpoint = endpoint
+        self.text_field = text_field
+        self.text_required = text_required
+        self.columns = columns or {}
+        self.optional_columns = optional_columns or {}
+        self.media_fields = media_fields
+
+    def build(self, phone, text, row, column_indexes, resolve_media=None, reference=""):
+        """Return (data, error) for one row; exactly one of them is None."""
+        if not phone:
+            return None, f"Message was not sent, because number is not specified"
+        if self.text_required and not text:
+            return None, f"Message was not sent to: {phone}, because message text is missing"
+
+        data = {
+            "priority": 1,
+            "referenceId": reference,
+            "to": phone
+        }
+        if self.text_field and text:
+            data[self.text_field] = text
+
+        for field, column in self.columns.items():
+            index = column_indexes.get(column)
+            value = row[index] if index is not None else None
+            if not value:
+                return None, f"Message was not sent to: {phone}, because {column} is missing"
+            if field in self.media_fields and resolve_media:
+                value = resolve_media(value)
+                if not value:
+                    return None, f"Message was not sent to: {phone}, because {column} could not be uploaded"
+            data[field] = value
+
+        for field, column in self.optional_columns.items():
+            index = column_indexes.get(column)
+            if index is not None and row[index]:
+                data[field] = row[index]
+
+        return data, None
+
+
+MESSAGE_TYPES = {
+    "chat": MessageType("chat", text_field="body", text_required=True),
+    "image": MessageType("image", text_field="caption", columns={"image": "photo url"}, media_fields=("image",)),
+    "video": MessageType("video", text_field="caption", columns={"video": "video url"}, media_fields=("video",)),
+    "document": MessageType("document", text_field="caption",
+                            columns={"document": "document url", "filename": "document name"},
+                            media_fields=("document",)),
+    "audio": MessageType("audio", columns={"audio": "audio url"}, media_fields=("audio",)),
+    "location": MessageType("location", text_field="address", text_required=True,
+                            columns={"lat": "latitude", "lng": "longitude"}),
+}
+
+
+def pool_from_config(config):
+    # The main instance plus any extra ones listed in ULTRAMSG_INSTANCES as "instance_id:token, ..."
+    instances = []
+    if config.ultramsg_instance_id:
+        instances.append((config.ultramsg_instance_id, config.ultramsg_token))
+    for instance in parse_instances(config.ultramsg_instances):
+        if instance not in instances:
+            instances.append(instance)
+
+    clients = [get_client(instance_id, token,
+                          pool_size=config.pool_size or DEFAULT_POOL_SIZE,
+                          connect_timeout=config.connect_timeout or DEFAULT_CONNECT_TIMEOUT,
+                          read_timeout=config.read_timeout or DEFAULT_READ_TIMEOUT,
+                          rate=config.rate_limit or DEFAULT_RATE,
+                          max_rate=config.max_rate_limit or MAX_RATE,
+                          max_attempts=config.max_attempts or DEFAULT_MAX_ATTEMPTS,
+                          api_url=config.ultramsg_api_url or API_URL)
+               for instance_id, token in instances]
+    return InstancePool(clients)
+
+
+def open_journal(config):
+    return SendJournal(config.journal_path) if config.journal_path else None
+
+
+def open_status_store(config):
+    return StatusStore(config.status_store_path) if config.status_store_path else None
+
+
+def open_media_cache(config):
+    # Without a cache file local media is still uploaded, once per file and campaign
+    return MediaCache(config.media_cache_path or ":memory:")
+
+
+def post_message(pool, endpoint, job, budget=None):
+    # Rows that failed validation are carried through the engine only to keep the log in row order
+    if job["data"] is None:
+        return None
+    if budget:
+        budget.acquire()
+    return pool.send(endpoint, job["data"], job["phone"])
+
+
+def post_batch(pool, endpoint, jobs, budget=None):
+    # Messages of one batch share a concurrency slot and a rate limiter reservation per instance
+    valid = [job for job in jobs if job["data"] is not None]
+    if budget and valid:
+        budget.acquire(len(valid))
+    responses = dict(zip(map(id, valid), pool.send_batch(endpoint, [(job["data"], job["phone"]) for job in valid])))
+    return [responses.get(id(job)) for job in jobs]
+
+
+def campaign_columns(message_type, format):
+    # Columns a campaign reads, so column-oriented sources can leave out the rest
+    return (set(BASE_COLUMNS) | template_columns(format) | set(message_type.columns.values())
+            | set(message_type.optional_columns.values()))
+
+
+def is_sent(response):
+    return bool(response) and ("sent" in response) and (response["sent"] == "true")
+
+
+def send_entries(message_type, entries, columns, campaign, config, pool, journal=None, status_store=None,
+                 control=None, remaining=None, on_message=None):
+    """Validate, dispatch and record (key, phone, row, text) entries: the part of a campaign that can also
+    run in a worker process (see partitions.py).
+
+    `on_message(status, job)` is called in row order for every message. `remaining()` is the number of
+    messages this call is expected to send, for pacing. Returns the SendStats.
+    """
+    concurrency = config.concurrency or DEFAULT_CONCURRENCY
+    batch_size = config.batch_size or DEFAULT_BATCH_SIZE
+    flush_interval = config.flush_interval or DEFAULT_FLUSH_INTERVAL
+
+    # Local files in media columns are uploaded once and then sent by URL
+    media_cache = open_media_cache(config)
+    resolve_media = partial(media_cache.resolve, upload=pool.upload)
+
+    # A scheduled campaign is spread over its time window instead of going out as fast as possible
+    pacer = WindowPacer(config.spread_until, control) if config.spread_until else None
+
+    def build_jobs():
+        produced = 0
+        for key, phone, row, text in entries:
+            # Validate (again, without pre-flight) and resolve media
+            data, error = message_type.build(phone, text, row, columns, resolve_media=resolve_media,
+                                             reference=reference_id(campaign, key))
+            if data:
+                logger.debug("Sending %s: %s", message_type.endpoint, data)
+                if pacer and not pacer.wait(remaining() - produced):
+                    return
+            produced += 1
+            yield {"key": key, "phone": phone, "data": data, "error": error}
+
+    # Shared by all campaigns of the process, e.g. the jobs of the scheduler running side by side
+    budget = get_rate_budget(config.global_rate_limit) if config.global_rate_limit else None
+    send = partial(post_message, pool, message_type.endpoint, budget=budget)
+    stats = SendStats(batch_size, flush_interval)
+    try:
+        for job, response in dispatch_in_order(build_jobs(), send, concurrency=concurrency, control=control,
+                                               max_concurrency=MAX_INSTANCE_CONCURRENCY * len(pool),
+                                               send_batch=partial(post_batch, pool, message_type.endpoint,
+                                                                  budget=budget),
+                                               batch_size=batch_size, flush_interval=flush_interval, stats=stats):
+            if job["error"]:
+                status = STATUS_INVALID
+            elif is_sent(response):
+                status = STATUS_SENT
+                job["message_id"] = response.get("id")
+                if status_store:
+                    status_store.record_sent(job["data"]["referenceId"], job["phone"], response.get("id"))
+            else:
+                status = STATUS_FAILED
+            count("messages_total", "Messages by outcome", result=status)
+            if journal:
+                journal.record(campaign, job["key"], job["phone"], status)
+            if on_message:
+                on_message(status, job)
+    finally:
+        media_cache.close()
+    return stats
+
+
+def run_campaign(message_type, format, config, update_progress_callback=None, write_log_callback=None,
+                 completion_callback=None, error_callback=None, control=None, stats_callback=None):
+    """Send one campaign: source -> filter -> render -> validate -> dispatch -> record.
+
+    Every message type goes through the same concurrency, rate limiting, retry and journal layers.
+    `config` is a CampaignConfig; a dict of settings is parsed into one first.
+    `stats_callback` receives the batching stats (SendStats.as_dict()) once the campaign is done.
+    """
+    if not isinstance(config, CampaignConfig):
+        config = CampaignConfig.from_dict(config)
+    if config.metrics_port:
+        serve_metrics(config.metrics_port)
+    # Time spent in the UI is a stage of its own
+    update_progress_callback = timed_callback(update_progress_callback)
+    write_log_callback = timed_callback(write_log_callback)
+
+    pool = pool_from_config(config)
+    if not len(pool):
+        if error_callback:
+            error_callback("No Ultramsg instance configured, check your settings")
+        return
+    message_delay = config.message_delay
+
+    # Source and filter: only selected rows are streamed from the sheet or the recipients file
+    try:
+        source = source_from_config(config)
+    except ValueError as e:
+        if error_callback:
+            error_callback(str(e))
+        return
+    rows = source.open(error_callback=error_callback, columns=campaign_columns(message_type, format))
+    if not rows:
+        return
+    if not rows.has_rows():
+        if error_callback:
+            error_callback(f"No selected messages")
+        return
+
+    if message_delay > 1:
+        pool.update_settings({"sendDelay": message_delay})
+
+    # Also the prefix of every referenceId, so delivery acks can be matched to this campaign
+    campaign = campaign_key(*source.key, message_type.endpoint, format)
+    completed = {}
+    sheet_writer = journal = status_store = None
+    try:
+        if config.write_back:
+            sheet_writer = source.open_writer(rows.headers, on_error=write_log_callback)
+            if not sheet_writer and write_log_callback:
+                write_log_callback(f"Results can only be written back to a Google Sheet, not to {source.name}")
+        journal = open_journal(config)
+        if journal:
+            completed = journal.start_campaign(campaign)
+        status_store = open_status_store(config)
+
+        current_message = 1
+        sent_count = 0
+        resumed = 0
+
+        # Parsed once per campaign, rendering a row is then a single join
+        template = compile_template(format, rows.columns)
+        phone_index = rows.columns.get("Phone number")
+
+        def pending_rows():
+            nonlocal resumed
+            for row_number, row in rows:
+                phone = row[phone_index] if phone_index is not None else None
+                key = row_key(row_number, phone)
+                if key in completed:
+                    resumed += 1
+                    continue
+                yield key, phone, row
+
+        rejected_count = 0
+        if config.preflight:
+            # Validate, normalise and deduplicate the whole campaign before the first request goes out
+            pending = list(pending_rows())
+            with stage(PREFLIGHT):
+                entries, rejected, summary = preflight(pending, message_type, template, rows.columns,
+                                                       default_country_code=config.default_country_code,
+                                                       sent_phones=completed.values())
+            rejected_count = len(rejected)
+            count("messages_total", "Messages by outcome", rejected_count, result=STATUS_INVALID)
+            for key, phone, error in rejected:
+                if journal:
+                    journal.record(campaign, key, phone, STATUS_INVALID)
+                if sheet_writer:
+                    sheet_writer.record(key_row(key), STATUS_INVALID)
+                if write_log_callback:
+                    write_log_callback(error)
+            if write_log_callback:
+                write_log_callback(summary)
+        else:
+            def render_rows():
+                for key, phone, row in pending_rows():
+                    with stage(RENDER):
+                        text = template.render(row)
+                    yield key, phone, row, text
+
+            entries = render_rows()
+
+        def remaining():
+            # Grows while later pages of the sheet are still downloading
+            return rows.selected_count - resumed - rejected_count
+
+        def on_message(status, job):
+            nonlocal current_message, sent_count
+            if sheet_writer:
+                sheet_writer.record(key_row(job["key"]), status, job.get("message_id"))
+            if status == STATUS_INVALID:
+                if write_log_callback:
+                    write_log_callback(job["error"])
+                return
+
+            if update_progress_callback:
+                update_progress_callback(current_message, max(remaining(), current_message))
+            current_message += 1
+            if status == STATUS_SENT:
+                sent_count += 1
+                if write_log_callback:
+                    write_log_callback(f"Message sent to: {job['phone']}")
+            elif write_log_callback:
+                write_log_callback(f"Message was not sent to: {job['phone']}")
+
+        if config.processes > 1:
+            # Only imported for campaigns that ask for it, multiprocessing is not needed otherwise
+            from partitions import run_partitions
+
+            stats = run_partitions(message_type, list(entries), rows.columns, campaign, config, control=control,
+                                   on_message=on_message, write_log_callback=write_log_callback)
+        else:
+            stats = send_entries(message_type, entries, rows.columns, campaign, config, pool, journal=journal,
+                                 status_store=status_store, control=control, remaining=remaining, on_message=on_message)
+
+        # Every page has been read once the rows are exhausted, so the count is final here
+        total_messages = rows.selected_count - resumed
+        if resumed and write_log_callback:
+            write_log_callback(f"Resumed campaign, skipped {resumed} messages sent before")
+
+        cancelled = control is not None and control.cancelled
+        # A cancelled campaign stays open, so the next run of it resumes instead of starting over
+        if journal and not cancelled:
+            failed = journal.finish_campaign(campaign)
+            if failed and write_log_callback:
+                write_log_callback(f"{failed} messages failed, sending this campaign again only retries them")
+    finally:
+        # Also after an error: buffered results are written and the writer threads stop, and the journal
+        # keeps the last batch so a resume skips those rows
+        if sheet_writer:
+            sheet_writer.close()
+        if status_store:
+            status_store.close()
+        if journal:
+            journal.close()
+
+    if sheet_writer and sheet_writer.requests and write_log_callback:
+        write_log_callback(f"Results written to the sheet in {sheet_writer.requests} requests")
+    if status_store and sent_count and write_log_callback:
+        write_log_callback(f"Delivery reports of this campaign: {campaign_id(campaign)}")
+
+    if cancelled and write_log_callback:
+        write_log_callback(f"Sending cancelled after {current_message - 1} of "
+                           f"{total_messages - rejected_count} messages")
+
+    if stats.batch_size > 1 and write_log_callback:
+        write_log_callback(f"Sent in {stats.batches} batches of {stats.mean_batch_size:.1f} messages on average, "
+                           f"{stats.timed_flushes} flushed after {stats.flush_interval:g} s")
+    if stats_callback:
+        stats_callback(stats.as_dict())
+    if config.metrics_path:
+        METRICS.write_json(config.metrics_path)
+
+    if completion_callback:
+        completion_callback(sent_count, total_messages - sent_count)
@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+
+from media_cache import is_local_path
+from metrics import stage, RENDER
+
+E164_PATTERN = r"^\+[1-9]\d{7,14}$"
+# WhatsApp chat and group IDs, e.g. 14155550123@c.us or 120363042612345678@g.us, which Ultramsg accepts as "to"
+CHAT_ID_PATTERN = r"^\S+@[cg]\.us$"
+URL_PATTERN = r"^https?://\S+$"
+
+# WhatsApp limits for the field the rendered template goes into
+MAX_TEXT_LENGTH = {
+    "body": 4096,
+    "caption": 1024,
+}
+
+NO_PHONE = "no_phone"
+INVALID_PHONE = "invalid_phone"
+NO_TEXT = "no_text"
+TEXT_TOO_LONG = "text_too_long"
+NO_COLUMN = "no_column"
+INVALID_MEDIA = "invalid_media"
+DUPLICATE = "duplicate"
+
+SUMMARY_LABELS = {
+    NO_PHONE: "without number",
+    INVALID_PHONE: "invalid numbers",
+    NO_TEXT: "without text",
+    TEXT_TOO_LONG: "text too long",
+    NO_COLUMN: "with empty required columns",
+    INVALID_MEDIA: "invalid media",
+    DUPLICATE: "duplicate numbers",
+}
+
+
+def normalize_phones(phones, default_country_code=None):
+    """Normalise a Series of phone numbers to E.164; numbers that cannot be normalised become NaN.
+
+    "00" is read as an international prefix. Numbers without "+" or "00" get `default_country_code`
+    when one is given, otherwise they are taken to already start with the country code. Chat and
+    group IDs (...@c.us, ...@g.us) are passed through unchanged.
+    """
+    raw = phones.fillna("").astype(str).str.strip()
+    chat_ids = raw.str.match(CHAT_ID_PATTERN)
+    international = raw.str.startswith("+") | raw.str.startswith("00")
+    digits = raw.str.replace(r"\D", "", regex=True)
+    digits = digits.where(~raw.str.startswith("00"), digits.str[2:])
+    if default_country_code:
+        country_code = str(default_country_code).lstrip("+")
+        digits = digits.where(international, country_code + digits.str.lstrip("0"))
+    normalized = "+" + digits
+    return normalized.where(normalized.str.match(E164_PATTERN)).where(~chat_ids, raw)
+
+
+def render_frame(template, frame):
+    # The compiled template applied to whole columns at once: literals broadcast, fields are string columns
+    text = pd.Series("", index=frame.index, dtype=object)
+    field_positions = dict(template.fields)
+    for position, part in enumerate(template.parts):
+        if position in field_positions:
+            text = text + frame[field_positions[position]].fillna("").astype(str)
+        elif part:
+            text = text + part
+    return text
+
+
+def message_error(code, phone, limit=None):
+    # Same wording as the errors the senders log for rows that are skipped while sending.
+    # Column checks carry the column name after the code, as in "no_column|photo url"
+    code, _, column = code.partition("|")
+    if code == NO_PHONE:
+        return "Message was not sent, because number is not specified"
+    if code == INVALID_PHONE:
+        return f"Message was not sent to: {phone}, because it is not a valid phone number"
+    if code == NO_TEXT:
+        return f"Message was not sent to: {phone}, because message text is missing"
+    if code == TEXT_TOO_LONG:
+        return f"Message was not sent to: {phone}, because message text is longer than {limit} characters"
+    if code == NO_COLUMN:
+        return f"Message was not sent to: {phone}, because {column} is missing"
+    if code == INVALID_MEDIA:
+        return f"Message was not sent to: {phone}, because {column} is neither a URL nor a local file"
+    return f"Message was not sent to: {phone}, because the number is already in this campaign"
+
+
+def preflight(entries, message_type, template, column_indexes, default_country_code=None, sent_phones=()):
+    """Check every pending row before any network traffic.
+
+    `entries` is a list of (key, phone, row). `sent_phones` are the numbers an earlier run of the same
+    campaign already sent to, which makes rows for them duplicates too. Returns (clean, rejected, summary):
+    clean is a list of (key, normalized_phone, row, text) ready for dispatch, rejected a list of
+    (key, phone, error message) and summary one line describing the whole pass.
+    """
+    if not entries:
+        return [], [], "Pre-flight: nothing to check"
+
+    frame = pd.DataFrame.from_records([row for _, _, row in entries])
+    raw_phones = pd.Series([phone for _, phone, _ in entries], dtype=object)
+    phones = normalize_phones(raw_phones, default_country_code)
+    with stage(RENDER):
+        text = render_frame(template, frame)
+
+    conditions = [raw_phones.isna() | (raw_phones.astype(str).str.strip() == ""), phones.isna()]
+    codes = [NO_PHONE, INVALID_PHONE]
+
+    if message_type.text_required:
+        conditions.append(text == "")
+        codes.append(NO_TEXT)
+    limit = MAX_TEXT_LENGTH.get(message_type.text_field)
+    if limit:
+        conditions.append(text.str.len() > limit)
+        codes.append(TEXT_TOO_LONG)
+
+    for field, column in message_type.columns.items():
+        index = column_indexes.get(column)
+        values = frame[index] if index is not None else pd.Series(None, index=frame.index, dtype=object)
+        missing = values.isna() | (values.astype(str).str.strip() == "")
+        conditions.append(missing)
+        codes.append(f"{NO_COLUMN}|{column}")
+        if field in message_type.media_fields:
+            # The file system is only asked once per distinct value
+            is_url = values.astype(str).str.match(URL_PATTERN)
+            local = values[~missing & ~is_url]
+            is_local = local.map({value: is_local_path(value) for value in local.unique()})
+            invalid = pd.Series(False, index=frame.index)
+            invalid[is_local.index] = ~is_local.astype(bool)
+            conditions.append(invalid)
+            codes.append(f"{INVALID_MEDIA}|{column}")
+
+    error_codes = pd.Series(np.select(conditions, codes, default=""), index=frame.index)
+
+    # Of rows that are otherwise fine, only the first message to each number is kept; rejected rows
+    # are left out so they do not turn a later valid row into a duplicate
+    valid = error_codes == ""
+    sent = normalize_phones(pd.Series(list(sent_phones), dtype=object), default_country_code).dropna()
+    duplicates = valid & (phones.where(valid).duplicated(keep="first") | phones.isin(set(sent)))
+    error_codes[duplicates] = DUPLICATE
+
+    clean = []
+    rejected = []
+    for position, (key, phone, row) in enumerate(entries):
+        code = error_codes.iat[position]
+        if code:
+            rejected.append((key, phone, message_error(code, phone, limit)))
+        else:
+            clean.append((key, phones.iat[position], row, text.iat[position]))
+
+    counts = error_codes[error_codes != ""].str.split("|").str[0].value_counts()
+    details = ", ".join(f"{counts[code]} {SUMMARY_LABELS[code]}" for code in SUMMARY_LABELS if code in counts)
+    summary = f"Pre-flight: {len(entries)} rows checked, {len(clean)} ready" + (f", {details}" if details else "")
+    return clean, rejected, summary
@@ -0,0 +1,113 @@
+import random
+import threading
+import time
+
+DEFAULT_RATE = 5.0  # messages per second a fresh instance starts with
+MIN_RATE = 0.2
+MAX_RATE = 20.0
+# Above this smoothed response time the instance is treated as overloaded
+LATENCY_TARGET = 2.0
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+DEFAULT_MAX_ATTEMPTS = 4
+DEFAULT_BASE_DELAY = 0.5
+DEFAULT_MAX_DELAY = 30.0
+
+_budgets = {}
+_budgets_lock = threading.Lock()
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def set_rate(self, rate):
+        with self.lock:
+            self._refill()
+            self.rate = rate
+            self.capacity = max(1.0, rate)
+            self.tokens = min(self.tokens, self.capacity)
+
+    def acquire(self, count=1):
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    # A batch may take more tokens than there are; the debt delays whoever comes next
+                    self.tokens -= count
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveRateLimiter:
+    """Token bucket whose rate follows the instance: additive increase while requests succeed quickly,
+    multiplicative decrease on throttling, server errors, timeouts or rising latency."""
+
+    def __init__(self, rate=DEFAULT_RATE, min_rate=MIN_RATE, max_rate=MAX_RATE, latency_target=LATENCY_TARGET):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.latency_target = latency_target
+        self.latency = None
+        self.bucket = TokenBucket(min(max(rate, min_rate), max_rate))
+        self.lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    def acquire(self, count=1):
+        self.bucket.acquire(count)
+
+    def _set_rate(self, rate):
+        self.bucket.set_rate(min(max(rate, self.min_rate), self.max_rate))
+
+    def on_success(self, latency):
+        with self.lock:
+            # Exponentially weighted average, so one slow response does not halve the rate
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+            if self.latency > self.latency_target:
+                self._set_rate(self.rate * 0.9)
+            else:
+                self._set_rate(self.rate + 0.1)
+
+    def on_throttled(self):
+        with self.lock:
+            self._set_rate(self.rate * 0.5)
+
+    def on_error(self):
+        with self.lock:
+            self._set_rate(self.rate * 0.75)
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, retry_after=None):
+        # Honour Retry-After when the server sends one, otherwise exponential backoff with full jitter
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+def get_rate_budget(rate, name="global"):
+    """Process-wide token bucket shared by every campaign that uses `name`, on top of each instance's own limiter."""
+    with _budgets_lock:
+        budget = _budgets.get(name)
+        if budget is None:
+            budget = _budgets[name] = TokenBucket(rate)
+        elif budget.rate != rate:
+            budget.set_rate(rate)
+        return budget
@@ -1,52 +1,247 @@
+import logging
+import os
+import queue
+import threading
+
+import google_auth_httplib2
+import httplib2
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
 from google.auth.exceptions import RefreshError
 
+from metrics import stage, count, SHEET_READ, ROW_PARSE
 
-def read_sheets(service_account_file, spreadsheet_id, sheet_number, error_callback=None):
-    range_name = f"Sheet{sheet_number}"
-    creds = Credentials.from_service_account_file(
-        service_account_file,
-        scopes=['https://www.googleapis.com/auth/spreadsheets.readonly'])
+READONLY_SCOPES = ('https://www.googleapis.com/auth/spreadsheets.readonly',)
+DRIVE_METADATA_SCOPES = ('https://www.googleapis.com/auth/drive.metadata.readonly',)
 
-    service = build('sheets', 'v4', credentials=creds)
+# Rows fetched per values().get call
+PAGE_SIZE = 5000
 
-    try:
-        # Call the Sheets API
-        sheet = service.spreadsheets()
-        result = sheet.values().get(spreadsheetId=spreadsheet_id, range=range_name).execute()
-        values = result.get('values', [])
+_END_OF_SHEET = object()
+
+logger = logging.getLogger(__name__)
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+def get_sheets_service(service_account_file, scopes=READONLY_SCOPES, api_endpoint=None):
+    return get_google_service('sheets', 'v4', service_account_file, scopes, api_endpoint=api_endpoint)
 
-        data = []
 
+def get_google_service(api, api_version, service_account_file, scopes, api_endpoint=None):
+    # One service per API, key file and scopes for the whole process: the credentials keep their access token
+    # until it expires, and the discovery document is loaded once from the copy bundled with the client.
+    # api_endpoint points the client at another server, e.g. the local stand-in used by the benchmarks
+    key = (api, api_version, os.path.abspath(service_account_file), os.path.getmtime(service_account_file),
+           tuple(scopes), api_endpoint)
+    with _services_lock:
+        service = _services.get(key)
+        if service is None:
+            creds = Credentials.from_service_account_file(service_account_file, scopes=list(scopes))
+
+            def build_request(http, *args, **kwargs):
+                # httplib2 is not thread-safe, so every request gets its own connection object
+                return HttpRequest(google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http()), *args, **kwargs)
+
+            service = build(api, api_version, requestBuilder=build_request,
+                            http=google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http()),
+                            static_discovery=True, cache_discovery=False,
+                            client_options={"api_endpoint": api_endpoint} if api_endpoint else None)
+            _services[key] = service
+        return service
+
+
+def fetch_pages(service, spreadsheet_id, sheet_number, page_size=PAGE_SIZE):
+    # Yield the sheet in row ranges; the first page starts with the header row
+    start = 1
+    while True:
+        range_name = f"Sheet{sheet_number}!{start}:{start + page_size - 1}"
+        result = service.spreadsheets().values().get(spreadsheetId=spreadsheet_id, range=range_name).execute()
+        values = result.get('values', [])
+        # The API leaves out trailing empty rows, so a page that ends in blank rows comes back short
+        # and only an empty page marks the end of the sheet
         if not values:
-            if error_callback:
-                error_callback(f"No data found, check your settings")
-        else:
-            # Assuming the first row contains the headers
-            headers = values[0]
-            data = []
-            for row in values[1:]:
-                # Fill missing cells with None
-                row_data = [(cell if cell != '' else None) for cell in row]
-                # Pad row_data if it's shorter than headers
-                row_data += [None] * (len(headers) - len(row_data))
-                data.append(dict(zip(headers, row_data)))
-
-        print(data)
-        return data
+            return
+        yield start, values
+        start += page_size
+
+
+def get_spreadsheet_version(service_account_file, spreadsheet_id, api_endpoint=None):
+    # Drive bumps the version on every edit, which makes it a cheap way to revalidate a cached sheet
+    service = get_google_service('drive', 'v3', service_account_file, DRIVE_METADATA_SCOPES, api_endpoint=api_endpoint)
+    try:
+        result = service.files().get(fileId=spreadsheet_id, fields="version,modifiedTime",
+                                     supportsAllDrives=True).execute()
+    except (RefreshError, HttpError) as e:
+        # Without Drive access the sheet is simply downloaded every time
+        logger.warning("Could not read spreadsheet version: %s", e)
+        return None
+    return f"{result.get('version')}:{result.get('modifiedTime')}"
+
+
+def to_row(cells, width):
+    # Empty cells become None and the row is padded or cut to the width of the header
+    row = tuple((cell if cell != '' else None) for cell in cells[:width])
+    if len(row) < width:
+        row += (None,) * (width - len(row))
+    return row
+
 
-    except RefreshError as e:
-        # Handle the RefreshError specifically
+def header_columns(headers):
+    # Header name -> index of its first column; blank and repeated headers do not move the columns after them
+    columns = {}
+    for index, header in enumerate(headers):
+        columns.setdefault(header, index)
+    return columns
+
+
+def handle_key_file_error(e, error_callback):
+    # A missing or malformed service account file
+    if error_callback:
+        error_callback(f"Could not load the service account file, check your settings")
+    logger.error("Could not load service account file: %s", e)
+
+
+def handle_read_error(e, error_callback):
+    if isinstance(e, RefreshError):
         if error_callback:
             error_callback(f"Authentication failed, check your system time")
-        print(f"Authentication failed: {e}")
-        return []
-
-    except HttpError as e:
-        # Invoke the error callback with the error message
+        logger.error("Authentication failed: %s", e)
+    else:
         if error_callback:
             error_callback(f"Failed to read sheet, check your settings")
-        print(e)
+        logger.error("Failed to read sheet: %s", e)
+
+
+class SelectedRows:
+    """Selected rows of a sheet, read page by page on a background thread.
+
+    `headers` is the header row and `columns` maps header names to tuple indexes. Iterating yields
+    (row_number, row) for every row whose Select column is TRUE, as soon as its page has arrived, while
+    later pages keep downloading. `selected_count` grows as pages arrive and is final once `finished` is set.
+    """
+
+    def __init__(self, headers, pages, error_callback=None):
+        self.headers = headers
+        self.columns = header_columns(headers)
+        self.selected_count = 0
+        self.finished = threading.Event()
+        self.error_callback = error_callback
+        self.rows = queue.Queue()
+        self.reader = threading.Thread(target=self.read_pages, args=(pages,), daemon=True)
+        self.reader.start()
+
+    def read_pages(self, pages):
+        width = len(self.headers)
+        select_index = self.columns.get("Select")
+        pages = iter(pages)
+        try:
+            while True:
+                with stage(SHEET_READ):
+                    page = next(pages, None)
+                if page is None:
+                    break
+                start, values = page
+                with stage(ROW_PARSE):
+                    for offset, cells in enumerate(values):
+                        row_number = start + offset
+                        # Skip the header row and cheaply drop unselected rows before building a tuple
+                        if row_number == 1 or select_index is None or select_index >= len(cells):
+                            continue
+                        if cells[select_index] != "TRUE":
+                            continue
+                        self.selected_count += 1
+                        self.rows.put((row_number, to_row(cells, width)))
+                count("sheet_rows_total", "Sheet rows read", len(values))
+        except (RefreshError, HttpError, OSError, ValueError) as e:
+            # OSError and ValueError come from local recipient files, see sources.py
+            handle_read_error(e, self.error_callback)
+        finally:
+            self.finished.set()
+            self.rows.put(_END_OF_SHEET)
+
+    def has_rows(self):
+        # Wait until the first selected row arrives or the sheet turns out to have none
+        while not self.finished.is_set():
+            if self.selected_count:
+                return True
+            self.finished.wait(0.05)
+        return self.selected_count > 0
+
+    def __iter__(self):
+        while True:
+            item = self.rows.get()
+            if item is _END_OF_SHEET:
+                return
+            yield item
+
+
+def open_selected_rows(service_account_file, spreadsheet_id, sheet_number, page_size=PAGE_SIZE, error_callback=None,
+                       cache=None, api_endpoint=None):
+    """Fetch the first page synchronously for the header, then stream the selected rows in the background.
+
+    With a SheetCache the sheet is only downloaded when its Drive version differs from the cached copy.
+    """
+    try:
+        service = get_sheets_service(service_account_file, api_endpoint=api_endpoint)
+    except (OSError, ValueError) as e:
+        handle_key_file_error(e, error_callback)
+        return None
+
+    try:
+        version = get_spreadsheet_version(service_account_file, spreadsheet_id, api_endpoint) if cache else None
+        if version and cache.version(spreadsheet_id, sheet_number) == version:
+            pages = cache.read_pages(spreadsheet_id, sheet_number, page_size=page_size)
+        else:
+            pages = fetch_pages(service, spreadsheet_id, sheet_number, page_size=page_size)
+            if version:
+                pages = cache.write_pages(spreadsheet_id, sheet_number, version, pages)
+        with stage(SHEET_READ):
+            first_page = next(pages, None)
+    except (RefreshError, HttpError) as e:
+        handle_read_error(e, error_callback)
+        return None
+
+    if not first_page:
+        if error_callback:
+            error_callback(f"No data found, check your settings")
+        return None
+
+    def all_pages():
+        yield first_page
+        yield from pages
+
+    return SelectedRows(first_page[1][0], all_pages(), error_callback=error_callback)
+
+
+def read_sheets(service_account_file, spreadsheet_id, sheet_number, error_callback=None, api_endpoint=None):
+    # Whole sheet as a list of dicts, kept for callers that need every row at once
+    try:
+        service = get_sheets_service(service_account_file, api_endpoint=api_endpoint)
+    except (OSError, ValueError) as e:
+        handle_key_file_error(e, error_callback)
+        return []
+
+    try:
+        data = []
+        headers = None
+        for start, values in fetch_pages(service, spreadsheet_id, sheet_number):
+            if headers is None:
+                # Assuming the first row contains the headers
+                headers = values[0]
+                values = values[1:]
+            for row in values:
+                data.append(dict(zip(headers, to_row(row, len(headers)))))
+
+        if headers is None:
+            if error_callback:
+                error_callback(f"No data found, check your settings")
+
+        return data
+
+    except (RefreshError, HttpError) as e:
+        handle_read_error(e, error_callback)
         return []
@@ -0,0 +1,251 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_CONCURRENCY = 8
+# Upper bound of requests in flight against one Ultramsg instance, shared by every campaign in the process
+MAX_INSTANCE_CONCURRENCY = 16
+# Messages handed to one worker at a time; 1 sends every message as its own task
+DEFAULT_BATCH_SIZE = 1
+# Longest a partial batch waits for more messages before it is sent anyway
+DEFAULT_FLUSH_INTERVAL = 0.05  # seconds
+
+_END_OF_JOBS = object()
+
+_instance_semaphores = {}
+_instance_semaphores_lock = threading.Lock()
+
+
+class SendControl:
+    """Pause/cancel switch shared between the UI and a running campaign."""
+
+    def __init__(self):
+        self._running = threading.Event()
+        self._running.set()
+        self._cancelled = threading.Event()
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def cancel(self):
+        self._cancelled.set()
+        # Wake up a paused campaign so it can stop
+        self._running.set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def wait_if_paused(self):
+        self._running.wait()
+        return not self.cancelled
+
+    def sleep(self, seconds):
+        # Like time.sleep, but a cancel ends it early; returns False when cancelled
+        return not self._cancelled.wait(seconds)
+
+
+class WindowPacer:
+    """Spreads the messages of a campaign evenly over the time left until `deadline` (a Unix time).
+
+    The first message goes out at once; every next one waits (time left) / (messages left), so the
+    pace adapts when the count grows while the sheet is still downloading.
+    """
+
+    def __init__(self, deadline, control=None):
+        self.deadline = deadline
+        self.control = control
+        self.next_send = None
+
+    def wait(self, remaining):
+        """Wait for the slot of the next message, `remaining` counting it; returns False when cancelled."""
+        now = time.time()
+        if self.next_send is not None and self.next_send > now:
+            if self.control is not None:
+                if not self.control.sleep(self.next_send - now):
+                    return False
+            else:
+                time.sleep(self.next_send - now)
+            now = time.time()
+        self.next_send = now + max(0.0, self.deadline - now) / max(1, remaining)
+        return True
+
+
+class SendStats:
+    """Batching counters of one campaign, shown at its end."""
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.batches = 0
+        self.messages = 0
+        self.timed_flushes = 0
+        self.lock = threading.Lock()
+
+    def record_batch(self, size, timed_out=False):
+        with self.lock:
+            self.batches += 1
+            self.messages += size
+            if timed_out:
+                self.timed_flushes += 1
+
+    def merge(self, stats):
+        # Adds the as_dict() of another sender, e.g. a worker process of the same campaign
+        with self.lock:
+            self.batches += stats["batches"]
+            self.messages += stats["messages"]
+            self.timed_flushes += stats["timed_flushes"]
+
+    @property
+    def mean_batch_size(self):
+        return self.messages / self.batches if self.batches else 0.0
+
+    def as_dict(self):
+        return {
+            "batch_size": self.batch_size,
+            "flush_interval": self.flush_interval,
+            "batches": self.batches,
+            "messages": self.messages,
+            "mean_batch_size": round(self.mean_batch_size, 2),
+            "timed_flushes": self.timed_flushes,
+        }
+
+
+def resolve_concurrency(value, max_concurrency=MAX_INSTANCE_CONCURRENCY):
+    # Accept ints as well as strings coming from the settings file
+    try:
+        concurrency = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_CONCURRENCY
+    return max(1, min(concurrency, max_concurrency))
+
+
+def get_instance_semaphore(instance_id):
+    with _instance_semaphores_lock:
+        semaphore = _instance_semaphores.get(instance_id)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(MAX_INSTANCE_CONCURRENCY)
+            _instance_semaphores[instance_id] = semaphore
+        return semaphore
+
+
+def iter_batches(jobs, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL, stats=None):
+    """Group jobs into lists of up to `batch_size`.
+
+    Jobs are pulled on a helper thread, so a batch that is still filling up is sent anyway once its first
+    job has waited `flush_interval`, e.g. while later pages of the sheet are downloading.
+    """
+    if batch_size <= 1:
+        for job in jobs:
+            if stats is not None:
+                stats.record_batch(1)
+            yield [job]
+        return
+
+    feed = queue.Queue(maxsize=batch_size * 4)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                feed.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def fill():
+        try:
+            for job in jobs:
+                if not put(job):
+                    return
+        except Exception as e:
+            # Handed over, so a failing job source still fails the campaign instead of ending it quietly
+            put(e)
+            return
+        put(_END_OF_JOBS)
+
+    threading.Thread(target=fill, daemon=True, name="ultramsg-batch-feed").start()
+    try:
+        finished = False
+        while not finished:
+            job = feed.get()
+            if job is _END_OF_JOBS:
+                return
+            if isinstance(job, Exception):
+                raise job
+            batch = [job]
+            deadline = time.monotonic() + flush_interval
+            timed_out = False
+            while len(batch) < batch_size:
+                try:
+                    job = feed.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    timed_out = True
+                    break
+                if job is _END_OF_JOBS or isinstance(job, Exception):
+                    # Send what was collected; an exception is raised with the next get
+                    if isinstance(job, Exception):
+                        feed.put(job)
+                    finished = job is _END_OF_JOBS
+                    break
+                batch.append(job)
+            if stats is not None:
+                stats.record_batch(len(batch), timed_out)
+            yield batch
+    finally:
+        # Stop reading the sheet when the caller stops early, e.g. after a cancel
+        stopped.set()
+
+
+def dispatch_in_order(jobs, send, concurrency=DEFAULT_CONCURRENCY, control=None,
+                      max_concurrency=MAX_INSTANCE_CONCURRENCY, send_batch=None, batch_size=DEFAULT_BATCH_SIZE,
+                      flush_interval=DEFAULT_FLUSH_INTERVAL, stats=None):
+    """Run send(job) for every job on a thread pool and yield (job, result) in the order of jobs.
+
+    At most `concurrency` requests are in flight for this call, capped at `max_concurrency`; the
+    InstancePool behind `send` limits each instance to MAX_INSTANCE_CONCURRENCY across all campaigns.
+    Results are yielded on the calling thread, so callbacks driven by the caller keep running where
+    they always did. When a SendControl is given, no new job is started while it is paused, and after
+    a cancel only the requests already in flight are finished; jobs that were never started are not
+    yielded at all, so they are neither reported as failed nor recorded.
+
+    With a `batch_size` above 1 jobs are coalesced (see iter_batches) and each batch is one task for
+    `send_batch(batch)`, which returns the results in order; by default it calls send() per job.
+    """
+    concurrency = resolve_concurrency(concurrency, max_concurrency)
+    if send_batch is None:
+        send_batch = lambda batch: [send(job) for job in batch]  # noqa: E731
+
+    def guarded_send(batch):
+        # Batches already queued also honour pause/cancel, so a cancel takes effect within one batch
+        if control is not None and not control.wait_if_paused():
+            return None
+        return send_batch(batch)
+
+    def results(batch, future):
+        # None: the batch was skipped after a cancel
+        sent = future.result()
+        return zip(batch, sent) if sent is not None else ()
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="ultramsg-send") as executor:
+        pending = deque()
+        for batch in iter_batches(jobs, batch_size, flush_interval, stats):
+            if control is not None and not control.wait_if_paused():
+                break
+            pending.append((batch, executor.submit(guarded_send, batch)))
+            # Keep a small window of queued batches instead of submitting the whole sheet at once
+            if len(pending) >= concurrency * 2:
+                yield from results(*pending.popleft())
+
+        while pending:
+            yield from results(*pending.popleft())
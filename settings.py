@@ -1,6 +1,11 @@
 import configparser
 import os
 
+JOURNAL_FILE = "send_journal.sqlite3"
+MEDIA_CACHE_FILE = "media_cache.sqlite3"
+STATUS_STORE_FILE = "message_status.sqlite3"
+CAMPAIGN_QUEUE_FILE = "campaign_queue.sqlite3"
+
 
 def get_persistent_settings_path():
     home_dir = os.path.expanduser("~")
@@ -13,20 +18,62 @@ def get_persistent_settings_path():
     return settings_path
 
 
+def get_log_path(name="send.log"):
+    home_dir = os.path.expanduser("~")
+    log_dir = os.path.join(home_dir, ".myapp", "logs")
+
+    if not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+
+    return os.path.join(log_dir, name)
+
+
+def get_app_file(name):
+    # A file in the application directory, e.g. one of the SQLite stores named above
+    app_dir = os.path.join(os.path.expanduser("~"), ".myapp")
+
+    if not os.path.exists(app_dir):
+        os.makedirs(app_dir)
+
+    return os.path.join(app_dir, name)
+
+
+def get_sheet_cache_dir():
+    home_dir = os.path.expanduser("~")
+    return os.path.join(home_dir, ".myapp", "sheet_cache")
+
+
 def save_settings_to_file(settings):
+    settings_path = get_persistent_settings_path()
     config = configparser.ConfigParser()
+    # Profiles in the same file are kept
+    config.read(settings_path)
     config['Settings'] = settings
-    settings_path = get_persistent_settings_path()
 
     with open(settings_path, 'w') as configfile:
         config.write(configfile)
 
 
-def load_settings_from_file():
+def profile_section(profile):
+    return f"Profile {profile}"
+
+
+def read_settings_file(settings_path=None, profile=None):
+    # Settings as a dict with lower case keys. A profile is a [Profile <name>] section whose values
+    # override those of [Settings], e.g. another Ultramsg instance or spreadsheet.
     config = configparser.ConfigParser()
-    settings_path = get_persistent_settings_path()
-    config.read(settings_path)
+    config.read(settings_path or get_persistent_settings_path())
 
-    if 'Settings' in config:
-        for key in config['Settings']:
-            os.environ[key.upper()] = config['Settings'][key]
+    settings = dict(config['Settings']) if 'Settings' in config else {}
+    if profile:
+        if profile_section(profile) not in config:
+            raise ValueError(f"Unknown settings profile: {profile}")
+        settings.update(config[profile_section(profile)])
+    return settings
+
+
+def get_profiles(settings_path=None):
+    config = configparser.ConfigParser()
+    config.read(settings_path or get_persistent_settings_path())
+    prefix = profile_section("")
+    return [section[len(prefix):] for section in config.sections() if section.startswith(prefix)]
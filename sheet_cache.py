@@ -0,0 +1,60 @@
+import json
+import os
+import tempfile
+
+from read import PAGE_SIZE
+
+
+class SheetCache:
+    """Raw sheet values on disk, one JSON-lines file per spreadsheet and sheet, tagged with the Drive version.
+
+    Rows are written and read back a page at a time, so a cached sheet never has to fit in memory.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def path(self, spreadsheet_id, sheet_number):
+        return os.path.join(self.cache_dir, f"{spreadsheet_id}-{sheet_number}.jsonl")
+
+    def version(self, spreadsheet_id, sheet_number):
+        try:
+            with open(self.path(spreadsheet_id, sheet_number), encoding="utf-8") as file:
+                return json.loads(file.readline())["version"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def read_pages(self, spreadsheet_id, sheet_number, page_size=PAGE_SIZE):
+        # Same (start row, values) pages as read.fetch_pages, served from disk
+        with open(self.path(spreadsheet_id, sheet_number), encoding="utf-8") as file:
+            file.readline()
+            start = 1
+            values = []
+            for line in file:
+                values.append(json.loads(line))
+                if len(values) == page_size:
+                    yield start, values
+                    start += page_size
+                    values = []
+            if values:
+                yield start, values
+
+    def write_pages(self, spreadsheet_id, sheet_number, version, pages):
+        """Pass `pages` through while copying them to the cache; the file only replaces the old one once
+        every page has been read, so an interrupted download never leaves a partial cache behind."""
+        path = self.path(spreadsheet_id, sheet_number)
+        # A temporary file of its own, so campaigns reading the same sheet at once do not write into one file
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=f"{os.path.basename(path)}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                file.write(json.dumps({"version": version}) + "\n")
+                for start, values in pages:
+                    file.writelines(json.dumps(row) + "\n" for row in values)
+                    yield start, values
+            os.replace(temp_path, path)
+        except BaseException:
+            # Also when the reader stops early (GeneratorExit)
+            os.remove(temp_path)
+            raise
@@ -0,0 +1,167 @@
+import logging
+import threading
+from datetime import datetime
+
+from google.auth.exceptions import RefreshError
+from googleapiclient.errors import HttpError
+
+from read import get_sheets_service, header_columns
+
+WRITE_SCOPES = ('https://www.googleapis.com/auth/spreadsheets',)
+
+# Written next to the other columns; existing columns with these headers are reused
+STATUS_COLUMN = "Status"
+SENT_AT_COLUMN = "Sent at"
+MESSAGE_ID_COLUMN = "Message ID"
+RESULT_COLUMNS = (STATUS_COLUMN, SENT_AT_COLUMN, MESSAGE_ID_COLUMN)
+
+# One values.batchUpdate per this many rows or seconds, whichever comes first: a 50k-row campaign
+# makes a few dozen write requests, well inside the Sheets quota of 60 per minute
+WRITE_BACK_BATCH_ROWS = 2000
+WRITE_BACK_INTERVAL = 10.0  # seconds
+# googleapiclient retries 429 and 5xx answers with exponential backoff
+WRITE_RETRIES = 5
+# Rows written in between are sent as nulls, which the API skips: worker processes finish rows out of order,
+# and a few nulls are cheaper than a range per row
+MAX_ROW_GAP = 100
+
+logger = logging.getLogger(__name__)
+
+
+def column_letter(index):
+    # 0 -> A, 25 -> Z, 26 -> AA
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+def row_blocks(row_numbers, max_gap=MAX_ROW_GAP):
+    # Nearby rows as (first, last), so a run of rows becomes one range
+    blocks = []
+    for row_number in sorted(row_numbers):
+        if blocks and row_number - blocks[-1][1] <= max_gap + 1:
+            blocks[-1][1] = row_number
+        else:
+            blocks.append([row_number, row_number])
+    return blocks
+
+
+def column_runs(indexes):
+    # Adjacent columns as [(position in indexes, column index), ...] runs, each written as one range
+    runs = []
+    for position, index in enumerate(indexes):
+        if runs and index == runs[-1][-1][1] + 1:
+            runs[-1].append((position, index))
+        else:
+            runs.append([(position, index)])
+    return runs
+
+
+class SheetWriter:
+    """Writes the result of every row back to the sheet: status, time and Ultramsg message ID.
+
+    Results are collected in memory and written by a background thread with one values.batchUpdate
+    per WRITE_BACK_BATCH_ROWS rows or WRITE_BACK_INTERVAL seconds. Write errors (e.g. a service account
+    without edit access) are reported once through `on_error` and turn write-back off for the campaign.
+    """
+
+    def __init__(self, service, spreadsheet_id, sheet_number, headers, on_error=None,
+                 batch_rows=WRITE_BACK_BATCH_ROWS, interval=WRITE_BACK_INTERVAL):
+        self.service = service
+        self.spreadsheet_id = spreadsheet_id
+        self.sheet_number = sheet_number
+        self.on_error = on_error
+        self.batch_rows = batch_rows
+        self.interval = interval
+        self.requests = 0
+        self.failed = False
+
+        # Result columns missing from the header are added after the last column
+        columns = header_columns(headers)
+        width = len(headers)
+        # Header cells still to write, by column index
+        self.new_headers = {}
+        self.result_columns = []
+        for name in RESULT_COLUMNS:
+            if name in columns:
+                index = columns[name]
+            else:
+                index = width
+                width += 1
+                self.new_headers[index] = name
+            self.result_columns.append(index)
+
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.wake = threading.Condition(self.lock)
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, daemon=True, name="sheet-writer")
+        self.thread.start()
+
+    def record(self, row_number, status, message_id=None):
+        values = (status, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), message_id or "")
+        with self.lock:
+            if self.failed:
+                return
+            self.pending[row_number] = values
+            if len(self.pending) >= self.batch_rows:
+                self.wake.notify()
+
+    def run(self):
+        while True:
+            with self.lock:
+                self.wake.wait_for(lambda: self.closed or len(self.pending) >= self.batch_rows, self.interval)
+                closed = self.closed
+                pending, self.pending = self.pending, {}
+            self.write(pending)
+            if closed:
+                return
+
+    def ranges(self, pending):
+        sheet = f"Sheet{self.sheet_number}"
+        data = []
+        for run in column_runs(sorted(self.new_headers)):
+            data.append({"range": f"{sheet}!{column_letter(run[0][1])}1:{column_letter(run[-1][1])}1",
+                         "values": [[self.new_headers[index] for _, index in run]]})
+        for first, last in row_blocks(pending):
+            for run in column_runs(self.result_columns):
+                values = []
+                for row_number in range(first, last + 1):
+                    cells = pending.get(row_number)
+                    values.append([cells[position] if cells else None for position, _ in run])
+                data.append({"range": f"{sheet}!{column_letter(run[0][1])}{first}:{column_letter(run[-1][1])}{last}",
+                             "values": values})
+        return data
+
+    def write(self, pending):
+        if not pending or self.failed:
+            return
+        body = {"valueInputOption": "RAW", "data": self.ranges(pending)}
+        try:
+            self.service.spreadsheets().values().batchUpdate(spreadsheetId=self.spreadsheet_id,
+                                                             body=body).execute(num_retries=WRITE_RETRIES)
+        except (RefreshError, HttpError, OSError) as e:
+            logger.error("Could not write results to the sheet: %s", e)
+            with self.lock:
+                self.failed = True
+                self.pending = {}
+            if self.on_error:
+                self.on_error("Could not write results to the sheet, check that the service account can edit it")
+            return
+        self.requests += 1
+        self.new_headers = {}
+
+    def close(self):
+        # Writes what is left; returns once the last request is done
+        with self.lock:
+            self.closed = True
+            self.wake.notify()
+        self.thread.join()
+
+
+def open_sheet_writer(service_account_file, spreadsheet_id, sheet_number, headers, on_error=None, api_endpoint=None):
+    service = get_sheets_service(service_account_file, scopes=WRITE_SCOPES, api_endpoint=api_endpoint)
+    return SheetWriter(service, spreadsheet_id, sheet_number, headers, on_error=on_error)
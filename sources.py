@@ -0,0 +1,235 @@
+import csv
+import datetime
+import logging
+import mmap
+import os
+
+from read import open_selected_rows, SelectedRows, PAGE_SIZE
+from sheet_cache import SheetCache
+
+# Read by every campaign, whatever its template and message type
+BASE_COLUMNS = ("Select", "Phone number")
+
+logger = logging.getLogger(__name__)
+
+
+def cell_text(value):
+    # Local files hold typed cells; the rest of the pipeline expects the strings the Sheets API returns
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, float) and value.is_integer():
+        # Phone numbers typed into a spreadsheet often come back as floats
+        return str(int(value))
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def normalize_select(rows):
+    # Exported files say True or true where a sheet says TRUE; rows are only sent when Select is exactly TRUE
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        return
+    yield header
+    select_index = header.index("Select") if "Select" in header else None
+    for row in rows:
+        if select_index is not None and select_index < len(row) and row[select_index].upper() == "TRUE":
+            row[select_index] = "TRUE"
+        yield row
+
+
+def paginate(rows, page_size=PAGE_SIZE):
+    # (start row, values) pages like read.fetch_pages; the header is row 1
+    start = 1
+    values = []
+    for row in rows:
+        values.append(row)
+        if len(values) == page_size:
+            yield start, values
+            start += page_size
+            values = []
+    if values:
+        yield start, values
+
+
+class RecipientSource:
+    """Where the recipients of a campaign come from.
+
+    open() returns SelectedRows that stream the selected rows, or None once the problem has been reported
+    to `error_callback`. `columns` is a hint of the columns the campaign reads; sources may leave out the
+    others. `key` identifies the list in the send journal. File sources only implement pages(), which
+    yields the same (start row, values) pages as the Sheets API, header row first.
+    """
+
+    name = "recipients"
+    key = ()
+
+    def pages(self, columns=None):
+        raise NotImplementedError
+
+    def open_writer(self, headers, on_error=None):
+        # Something with record(row_number, status, message_id) and close() to write results back, if the
+        # source supports it
+        return None
+
+    def open(self, error_callback=None, columns=None):
+        try:
+            pages = self.pages(columns)
+            first_page = next(pages, None)
+        except (OSError, ValueError, ImportError) as e:
+            logger.error("Failed to read %s: %s", self.name, e)
+            if error_callback:
+                error_callback(f"Failed to read {self.name}: {e}")
+            return None
+
+        if not first_page:
+            if error_callback:
+                error_callback(f"No data found in {self.name}")
+            return None
+
+        def all_pages():
+            yield first_page
+            yield from pages
+
+        return SelectedRows(first_page[1][0], all_pages(), error_callback=error_callback)
+
+
+class SheetsSource(RecipientSource):
+    name = "Google Sheet"
+
+    def __init__(self, service_account_file, spreadsheet_id, sheet_number, cache=None, api_endpoint=None):
+        self.service_account_file = service_account_file
+        self.spreadsheet_id = spreadsheet_id
+        self.sheet_number = sheet_number
+        self.cache = cache
+        self.api_endpoint = api_endpoint
+        # The same key as before there were other sources, so journals of running campaigns still match
+        self.key = (spreadsheet_id, sheet_number)
+
+    def open(self, error_callback=None, columns=None):
+        return open_selected_rows(service_account_file=self.service_account_file, spreadsheet_id=self.spreadsheet_id,
+                                  sheet_number=self.sheet_number, error_callback=error_callback, cache=self.cache,
+                                  api_endpoint=self.api_endpoint)
+
+    def open_writer(self, headers, on_error=None):
+        # Needs the write scope, so it is only imported and authorised when write-back is on
+        from sheet_writer import open_sheet_writer
+
+        return open_sheet_writer(self.service_account_file, self.spreadsheet_id, self.sheet_number, headers,
+                                 on_error=on_error, api_endpoint=self.api_endpoint)
+
+
+class CsvSource(RecipientSource):
+    """CSV read through a memory map: the OS pages the file in and out, so a 1M-row list costs one page of rows."""
+
+    def __init__(self, path, delimiter=",", encoding="utf-8-sig", page_size=PAGE_SIZE):
+        self.path = path
+        self.delimiter = delimiter
+        self.encoding = encoding
+        self.page_size = page_size
+        self.name = os.path.basename(path)
+        self.key = ("file", os.path.abspath(path))
+
+    def lines(self):
+        with open(self.path, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for line in iter(mapped.readline, b""):
+                    yield line.decode(self.encoding)
+
+    def rows(self):
+        try:
+            # csv.reader joins quoted values that span lines itself
+            yield from csv.reader(self.lines(), delimiter=self.delimiter)
+        except csv.Error as e:
+            raise ValueError(f"{self.name}: {e}")
+
+    def pages(self, columns=None):
+        return paginate(normalize_select(self.rows()), self.page_size)
+
+
+class XlsxSource(RecipientSource):
+    """First (or the named) worksheet of an .xlsx file, iterated row by row in openpyxl's read-only mode."""
+
+    def __init__(self, path, sheet=None, page_size=PAGE_SIZE):
+        self.path = path
+        self.sheet = sheet
+        self.page_size = page_size
+        self.name = os.path.basename(path)
+        self.key = ("file", os.path.abspath(path), sheet)
+
+    def pages(self, columns=None):
+        try:
+            import openpyxl
+        except ImportError:
+            raise ImportError("reading .xlsx files needs openpyxl (pip install openpyxl)")
+
+        workbook = openpyxl.load_workbook(self.path, read_only=True, data_only=True)
+        worksheet = workbook[self.sheet] if self.sheet else workbook.worksheets[0]
+
+        def rows():
+            try:
+                for row in worksheet.iter_rows(values_only=True):
+                    yield [cell_text(value) for value in row]
+            finally:
+                # Read-only workbooks keep the file open until closed
+                workbook.close()
+
+        return paginate(normalize_select(rows()), self.page_size)
+
+
+class ParquetSource(RecipientSource):
+    """Parquet read a row group batch at a time, loading only the columns the campaign uses."""
+
+    def __init__(self, path, page_size=PAGE_SIZE):
+        self.path = path
+        self.page_size = page_size
+        self.name = os.path.basename(path)
+        self.key = ("file", os.path.abspath(path))
+
+    def pages(self, columns=None):
+        try:
+            import pyarrow.parquet as parquet
+        except ImportError:
+            raise ImportError("reading .parquet files needs pyarrow (pip install pyarrow)")
+
+        parquet_file = parquet.ParquetFile(self.path)
+        names = parquet_file.schema_arrow.names
+        wanted = [name for name in names if columns is None or name in columns]
+
+        def rows():
+            yield wanted
+            for batch in parquet_file.iter_batches(batch_size=self.page_size, columns=wanted):
+                for row in zip(*(column.to_pylist() for column in batch.columns)):
+                    yield [cell_text(value) for value in row]
+
+        return paginate(normalize_select(rows()), self.page_size)
+
+
+FILE_SOURCES = {
+    ".csv": CsvSource,
+    ".tsv": lambda path: CsvSource(path, delimiter="\t"),
+    ".xlsx": XlsxSource,
+    ".xlsm": XlsxSource,
+    ".parquet": ParquetSource,
+}
+
+
+def file_source(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FILE_SOURCES:
+        raise ValueError(f"Unsupported recipients file {path}, use one of {', '.join(FILE_SOURCES)}")
+    return FILE_SOURCES[extension](os.path.expanduser(path))
+
+
+def source_from_config(config):
+    # A local recipients file when one is set, the Google Sheet otherwise
+    if config.recipients_file:
+        return file_source(config.recipients_file)
+    return SheetsSource(config.service_account_file, config.spreadsheet_id, config.sheet_number,
+                        cache=SheetCache(config.sheet_cache_dir) if config.sheet_cache_dir else None,
+                        api_endpoint=config.sheets_api_url)
@@ -0,0 +1,157 @@
+import queue
+import sqlite3
+import threading
+import time
+
+STATUS_BATCH_SIZE = 1000
+STATUS_FLUSH_INTERVAL = 0.5  # seconds
+
+# Ultramsg ack values in the order a message goes through them; a late "device" must not undo a "read"
+ACK_RANKS = {
+    "pending": 0,
+    "sent": 1,
+    "server": 1,
+    "device": 2,
+    "read": 3,
+    "played": 3,
+}
+DELIVERED_RANK = 2
+READ_RANK = 3
+
+# Characters of the campaign key used in referenceId; enough to tell campaigns apart
+CAMPAIGN_ID_LENGTH = 16
+
+_STOP = object()
+
+
+def campaign_id(campaign):
+    return campaign[:CAMPAIGN_ID_LENGTH]
+
+
+def reference_id(campaign, key):
+    # "<campaign id>/<sheet row>": short, and the campaign can be read back from every ack
+    return f"{campaign_id(campaign)}/{key.partition(':')[0]}"
+
+
+def campaign_of(reference):
+    return reference.partition("/")[0]
+
+
+class StatusStore:
+    """Delivery status of every sent message, keyed by the referenceId it was sent with.
+
+    Writes are queued and committed in batches by one writer thread, so neither the senders nor the
+    webhook receiver ever wait for the disk. Only the highest status seen is kept, whatever order the
+    acks arrive in.
+    """
+
+    def __init__(self, path, batch_size=STATUS_BATCH_SIZE, flush_interval=STATUS_FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = queue.Queue()
+        self.read_lock = threading.Lock()
+
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS messages (reference_id TEXT PRIMARY KEY, campaign TEXT NOT NULL, phone TEXT, "
+            "message_id TEXT, status TEXT NOT NULL, rank INTEGER NOT NULL, sent_at REAL, updated REAL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS messages_campaign ON messages (campaign, rank)")
+        self.connection.commit()
+        # Queries get their own connection, so they never wait behind a batch being written
+        self.reader = sqlite3.connect(path, check_same_thread=False, timeout=30)
+
+        self.writer = threading.Thread(target=self.write_batches, daemon=True, name="status-store")
+        self.writer.start()
+
+    def record_sent(self, reference, phone, message_id=None):
+        if reference:
+            self.pending.put(("sent", reference, phone, None if message_id is None else str(message_id), time.time()))
+
+    def record_ack(self, reference, status):
+        if reference and status in ACK_RANKS:
+            self.pending.put(("ack", reference, status, time.time()))
+
+    def write_batches(self):
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not _STOP:
+                try:
+                    batch.append(self.pending.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            stop = batch[-1] is _STOP
+            self.write([item for item in batch if item is not _STOP])
+            for _ in batch:
+                self.pending.task_done()
+            if stop:
+                return
+
+    def write(self, batch):
+        sent = [(reference, campaign_of(reference), phone, message_id, ACK_RANKS["sent"], updated)
+                for kind, reference, phone, message_id, updated in (item for item in batch if item[0] == "sent")]
+        acks = [(reference, campaign_of(reference), status, ACK_RANKS[status], updated)
+                for kind, reference, status, updated in (item for item in batch if item[0] == "ack")]
+        if sent:
+            self.connection.executemany(
+                "INSERT INTO messages (reference_id, campaign, phone, message_id, status, rank, sent_at, updated) "
+                "VALUES (?1, ?2, ?3, ?4, 'sent', ?5, ?6, ?6) ON CONFLICT (reference_id) DO UPDATE SET "
+                "phone = excluded.phone, message_id = excluded.message_id, sent_at = excluded.sent_at, "
+                # Sent before means the campaign is run again and starts over; otherwise an ack was
+                # simply faster than this record
+                "status = CASE WHEN sent_at IS NOT NULL OR excluded.rank > rank THEN excluded.status "
+                "ELSE status END, "
+                "rank = CASE WHEN sent_at IS NOT NULL THEN excluded.rank ELSE MAX(rank, excluded.rank) END",
+                sent)
+        if acks:
+            self.connection.executemany(
+                "INSERT INTO messages (reference_id, campaign, status, rank, updated) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (reference_id) DO UPDATE SET status = excluded.status, rank = excluded.rank, "
+                "updated = excluded.updated WHERE excluded.rank > rank", acks)
+        if sent or acks:
+            self.connection.commit()
+
+    def flush(self):
+        # Wait until everything queued so far is committed
+        self.pending.join()
+
+    def campaign_rates(self, campaign):
+        """Sent, delivered and read counts and rates of one campaign (key or referenceId prefix)."""
+        with self.read_lock:
+            sent, delivered, read = self.reader.execute(
+                "SELECT COUNT(*), COALESCE(SUM(rank >= ?), 0), COALESCE(SUM(rank >= ?), 0) FROM messages "
+                "WHERE campaign = ?", (DELIVERED_RANK, READ_RANK, campaign_id(campaign))).fetchone()
+        return {
+            "campaign": campaign_id(campaign),
+            "sent": sent,
+            "delivered": delivered,
+            "read": read,
+            "delivered_rate": round(delivered / sent, 4) if sent else None,
+            "read_rate": round(read / sent, 4) if sent else None,
+        }
+
+    def campaigns(self):
+        # Every campaign with its counts, most recent first
+        with self.read_lock:
+            rows = self.reader.execute(
+                "SELECT campaign, COUNT(*), COALESCE(SUM(rank >= ?), 0), COALESCE(SUM(rank >= ?), 0), "
+                "MAX(updated) FROM messages GROUP BY campaign ORDER BY MAX(updated) DESC",
+                (DELIVERED_RANK, READ_RANK)).fetchall()
+        return [{"campaign": campaign, "sent": sent, "delivered": delivered, "read": read, "updated": updated}
+                for campaign, sent, delivered, read, updated in rows]
+
+    def status(self, reference):
+        with self.read_lock:
+            row = self.reader.execute("SELECT status, phone, message_id, updated FROM messages WHERE reference_id = ?",
+                                      (reference,)).fetchone()
+        if not row:
+            return None
+        return {"reference_id": reference, "status": row[0], "phone": row[1], "message_id": row[2], "updated": row[3]}
+
+    def close(self):
+        self.pending.put(_STOP)
+        self.writer.join()
+        self.connection.close()
+        self.reader.close()
@@ -0,0 +1,65 @@
+import re
+
+TAG_PATTERN = re.compile(r"{{(.*?)}}", re.DOTALL)
+
+# MessageConstructor blocks and the sheet columns they stand for
+BLOCK_COLUMNS = {
+    "Name": "Name",
+    "Text": "text",
+    "Photo caption": "photo caption",
+    "Video caption": "video caption",
+}
+
+MEDIA_BLOCKS = ("Photo (default)", "Video (default)")
+
+
+class CompiledTemplate:
+    """A message format parsed once into literal parts and the row fields that fill the gaps between them."""
+
+    def __init__(self, parts, fields):
+        self.parts = parts
+        self.fields = fields
+
+    def render(self, row):
+        parts = self.parts[:]
+        for position, key in self.fields:
+            value = row[key]
+            if value:
+                parts[position] = value
+        return "".join(parts)
+
+
+def compile_template(format, columns, skip=MEDIA_BLOCKS):
+    """Compile `format` against `columns`, a mapping of column name to the key of that column in a row.
+
+    {{Name}}, {{Text}}, {{Photo caption}} and {{Video caption}} are the constructor blocks, any other
+    {{column}} is replaced by that column of the row, and tags that match no column are kept as text
+    (that is how custom text blocks are encoded).
+    """
+    parts = []
+    fields = []
+    pieces = TAG_PATTERN.split(format)
+    # re.split alternates literal text and tag names
+    for index, piece in enumerate(pieces):
+        if index % 2 == 0:
+            if piece:
+                parts.append(piece)
+            continue
+        if piece in skip:
+            continue
+        column = BLOCK_COLUMNS.get(piece, piece)
+        if column in columns:
+            fields.append((len(parts), columns[column]))
+            parts.append("")
+        elif piece in BLOCK_COLUMNS:
+            # A known block whose column is missing from the sheet renders as empty
+            continue
+        else:
+            parts.append(piece)
+    return CompiledTemplate(parts, fields)
+
+
+def template_columns(format, skip=MEDIA_BLOCKS):
+    # Column names `format` may read from a row, so column-oriented sources can load only those
+    return {BLOCK_COLUMNS.get(piece, piece) for index, piece in enumerate(TAG_PATTERN.split(format))
+            if index % 2 == 1 and piece not in skip}
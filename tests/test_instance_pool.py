@@ -0,0 +1,87 @@
+import time
+from types import SimpleNamespace
+
+from instance_pool import InstancePool, parse_instances, FAILURE_THRESHOLD
+from ultramsg_client import UNKNOWN_OUTCOME
+
+
+def make_pool(count):
+    return InstancePool([SimpleNamespace(instance_id=f"instance{index}") for index in range(count)])
+
+
+class FakeClient:
+    def __init__(self, instance_id, response):
+        self.instance_id = instance_id
+        self.response = response
+        self.sent = []
+
+    def send(self, endpoint, data):
+        self.sent.append(data)
+        return self.response
+
+    def send_batch(self, endpoint, batch):
+        return [self.send(endpoint, data) for data in batch]
+
+
+def pool_with_first_answering(response, phone):
+    # The instance the phone maps to answers with `response`, the other one sends the message
+    pool = InstancePool([FakeClient("a", None), FakeClient("b", None)])
+    first, second = pool.candidates(phone)
+    pool.clients[first].response = response
+    pool.clients[second].response = {"sent": "true"}
+    return pool, pool.clients[first], pool.clients[second]
+
+
+def test_parse_instances():
+    assert parse_instances(" a:1, b:2\nc:3,") == [("a", "1"), ("b", "2"), ("c", "3")]
+    assert parse_instances(None) == []
+
+
+def test_candidates_cover_every_instance_once():
+    pool = make_pool(4)
+    for phone in ("+14155550123", "+442079460958", None):
+        assert sorted(pool.candidates(phone)) == [0, 1, 2, 3]
+
+
+def test_candidates_are_stable_when_an_instance_is_added():
+    phones = [f"+1415555{number:04d}" for number in range(500)]
+    before = make_pool(3)
+    after = make_pool(4)
+    moved = [phone for phone in phones if before.candidates(phone)[0] != after.candidates(phone)[0]]
+    # Consistent hashing: only the recipients taken over by the new instance move
+    assert all(after.candidates(phone)[0] == 3 for phone in moved)
+    assert len(moved) < len(phones) / 2
+
+
+def test_failing_instance_moves_to_the_end():
+    pool = make_pool(3)
+    phone = "+14155550123"
+    first = pool.candidates(phone)[0]
+    for _ in range(FAILURE_THRESHOLD):
+        pool.record(first, False)
+    assert pool.candidates(phone)[-1] == first
+    pool.down_until[first] = time.monotonic()
+    assert pool.candidates(phone)[0] == first
+
+
+def test_rejected_message_fails_over():
+    phone = "+14155550123"
+    pool, first, second = pool_with_first_answering(None, phone)
+    assert pool.send("chat", {"to": phone}, phone) == {"sent": "true"}
+    assert len(first.sent) == len(second.sent) == 1
+
+
+def test_message_with_unknown_outcome_is_not_resent():
+    phone = "+14155550123"
+    pool, first, second = pool_with_first_answering(UNKNOWN_OUTCOME, phone)
+    assert pool.send("chat", {"to": phone}, phone) is UNKNOWN_OUTCOME
+    assert pool.send_batch("chat", [({"to": phone}, phone)]) == [UNKNOWN_OUTCOME]
+    assert len(first.sent) == 2
+    assert second.sent == []
+
+
+def test_batch_fails_over_rejected_messages():
+    phone = "+14155550123"
+    pool, first, second = pool_with_first_answering(None, phone)
+    assert pool.send_batch("chat", [({"to": phone}, phone), ({"to": phone}, phone)]) == [{"sent": "true"}] * 2
+    assert len(second.sent) == 2
@@ -0,0 +1,50 @@
+from journal import SendJournal, row_key, key_row, STATUS_SENT, STATUS_FAILED, STATUS_INVALID
+
+
+def test_row_key():
+    assert row_key(12, "+14155550123") == "12:+14155550123"
+    assert key_row(row_key(12, None)) == 12
+
+
+def test_interrupted_campaign_resumes(tmp_path):
+    path = str(tmp_path / "journal.sqlite3")
+    journal = SendJournal(path)
+    assert journal.start_campaign("c") == {}
+    journal.record("c", "2:a", "a", STATUS_SENT)
+    journal.record("c", "3:b", "b", STATUS_INVALID)
+    # Closed without finishing, as after a crash or a cancel
+    journal.close()
+
+    journal = SendJournal(path)
+    assert journal.start_campaign("c") == {"2:a": "a"}
+    journal.close()
+
+
+def test_campaign_with_failed_messages_stays_open(tmp_path):
+    journal = SendJournal(str(tmp_path / "journal.sqlite3"))
+    journal.start_campaign("c")
+    journal.record("c", "2:a", "a", STATUS_SENT)
+    journal.record("c", "3:b", "b", STATUS_FAILED)
+    assert journal.finish_campaign("c") == 1
+
+    assert journal.start_campaign("c") == {"2:a": "a"}
+    journal.record("c", "3:b", "b", STATUS_SENT)
+    assert journal.finish_campaign("c") == 0
+
+    # Sent again after it finished, the campaign is a new run
+    assert journal.start_campaign("c") == {}
+    journal.close()
+
+
+def test_pending_results_are_flushed_on_a_timer(tmp_path):
+    path = str(tmp_path / "journal.sqlite3")
+    journal = SendJournal(path, flush_interval=0.05)
+    journal.start_campaign("c")
+    journal.record("c", "2:a", "a", STATUS_SENT)
+    journal.closed.wait(0.3)
+
+    # Read by another connection while the campaign is still running, as after a crash
+    other = SendJournal(path)
+    assert other.start_campaign("c") == {"2:a": "a"}
+    other.close()
+    journal.close()
@@ -0,0 +1,91 @@
+import pandas as pd
+
+from pipeline import MESSAGE_TYPES
+from preflight import normalize_phones, preflight, render_frame
+from read import header_columns
+from templates import compile_template
+
+HEADERS = ["Select", "Name", "Phone number", "text", "photo url"]
+COLUMNS = header_columns(HEADERS)
+
+
+def entry(row_number, phone, name="Ann", text="Hello", photo=None):
+    return f"{row_number}:{phone}", phone, ("TRUE", name, phone, text, photo)
+
+
+def test_normalize_phones():
+    phones = pd.Series(["+1 (415) 555-0123", "0044 20 7946 0958", "04155550123", "12", "", None])
+    assert normalize_phones(phones).tolist()[:2] == ["+14155550123", "+442079460958"]
+    assert normalize_phones(phones).iloc[2:].isna().all()
+    assert normalize_phones(phones, default_country_code="+49").tolist()[2] == "+494155550123"
+
+
+def test_normalize_phones_keeps_chat_ids():
+    phones = pd.Series(["120363042612345678@g.us", "14155550123@c.us"])
+    assert normalize_phones(phones).tolist() == ["120363042612345678@g.us", "14155550123@c.us"]
+
+
+def test_render_frame_matches_render():
+    template = compile_template("Hi {{Name}}, {{Text}} {{Custom block}}{{Photo (default)}}", COLUMNS)
+    rows = [("TRUE", "Ann", "+1", "see you", None), ("TRUE", None, "+2", None, None), ("TRUE", "", "+3", "x", "a")]
+    rendered = render_frame(template, pd.DataFrame.from_records(rows))
+    assert rendered.tolist() == [template.render(row) for row in rows]
+    assert rendered[0] == "Hi Ann, see you Custom block"
+
+
+def test_preflight_rejects_and_deduplicates():
+    template = compile_template("{{Text}}", COLUMNS)
+    entries = [
+        entry(2, "+14155550123"),
+        entry(3, "+1 415 555 0123"),
+        entry(4, None),
+        entry(5, "12"),
+        entry(6, "+14155550124", text=None),
+        entry(7, "120363042612345678@g.us"),
+    ]
+    clean, rejected, summary = preflight(entries, MESSAGE_TYPES["chat"], template, COLUMNS)
+
+    assert [(key, phone, text) for key, phone, _, text in clean] == [
+        ("2:+14155550123", "+14155550123", "Hello"),
+        ("7:120363042612345678@g.us", "120363042612345678@g.us", "Hello"),
+    ]
+    assert [key for key, _, _ in rejected] == ["3:+1 415 555 0123", "4:None", "5:12", "6:+14155550124"]
+    assert "already in this campaign" in rejected[0][2]
+    assert summary == ("Pre-flight: 6 rows checked, 2 ready, 1 without number, 1 invalid numbers, "
+                       "1 without text, 1 duplicate numbers")
+
+
+def test_preflight_rejects_numbers_sent_in_an_earlier_run():
+    # Resumed campaign: row 2 went out before, row 5 has the same number in another notation
+    template = compile_template("{{Text}}", COLUMNS)
+    entries = [entry(5, "+1 (415) 555-0123"), entry(6, "+14155550124")]
+    clean, rejected, summary = preflight(entries, MESSAGE_TYPES["chat"], template, COLUMNS,
+                                         sent_phones=["+14155550123"])
+    assert [key for key, _, _, _ in clean] == ["6:+14155550124"]
+    assert [key for key, _, _ in rejected] == ["5:+1 (415) 555-0123"]
+    assert summary.endswith("1 duplicate numbers")
+
+
+def test_preflight_checks_media_columns(tmp_path):
+    photo = tmp_path / "photo.jpg"
+    photo.write_bytes(b"jpg")
+    template = compile_template("{{Name}}", COLUMNS)
+    entries = [
+        entry(2, "+14155550121", photo="https://example.com/a.jpg"),
+        entry(3, "+14155550122", photo=str(photo)),
+        entry(4, "+14155550123", photo=str(tmp_path / "missing.jpg")),
+        entry(5, "+14155550124"),
+    ]
+    clean, rejected, _ = preflight(entries, MESSAGE_TYPES["image"], template, COLUMNS)
+
+    assert [key for key, _, _, _ in clean] == ["2:+14155550121", "3:+14155550122"]
+    assert [error.split("because ")[1] for _, _, error in rejected] == [
+        "photo url is neither a URL nor a local file", "photo url is missing"]
+
+
+def test_preflight_with_repeated_headers():
+    headers = ["Select", "", "", "Phone number", "Name", "Name"]
+    template = compile_template("{{Name}}", header_columns(headers))
+    entries = [("2:+14155550123", "+14155550123", ("TRUE", None, None, "+14155550123", "Ann", "Other"))]
+    clean, _, _ = preflight(entries, MESSAGE_TYPES["chat"], template, header_columns(headers))
+    assert clean[0][3] == "Ann"
@@ -0,0 +1,44 @@
+from read import fetch_pages, header_columns, to_row
+
+
+class FakeValues:
+    """Stands in for service.spreadsheets().values(); leaves out trailing empty rows like the Sheets API."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.ranges = []
+
+    def get(self, spreadsheetId, range):
+        self.ranges.append(range)
+        return self
+
+    def execute(self):
+        first, last = (int(number) for number in self.ranges[-1].split("!")[1].split(":"))
+        values = self.rows[first - 1:last]
+        while values and not values[-1]:
+            values = values[:-1]
+        return {"values": values} if values else {}
+
+
+class FakeService:
+    def __init__(self, rows):
+        self.values_resource = FakeValues(rows)
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self.values_resource
+
+
+def test_fetch_pages_reads_past_blank_rows():
+    # Rows 5 and 6 are blank, so the second page (rows 4-6) comes back with one row
+    rows = [["Select"]] + [["TRUE"]] * 3 + [[], []] + [["TRUE"]] * 4
+    pages = list(fetch_pages(FakeService(rows), "sheet", 1, page_size=3))
+    assert [(start, len(values)) for start, values in pages] == [(1, 3), (4, 1), (7, 3), (10, 1)]
+
+
+def test_header_columns_keep_the_first_of_repeated_names():
+    headers = ["Select", "", "", "Phone number", "Name", "Name"]
+    assert header_columns(headers) == {"Select": 0, "": 1, "Phone number": 3, "Name": 4}
+    assert to_row(["TRUE", "", "", "+1", "Ann"], len(headers)) == ("TRUE", None, None, "+1", "Ann", None)
@@ -0,0 +1,74 @@
+import threading
+import time
+
+import pytest
+
+from send_engine import SendControl, SendStats, dispatch_in_order, iter_batches
+
+
+def test_cancel_does_not_yield_jobs_that_were_never_sent():
+    control = SendControl()
+    sent = []
+    release = threading.Event()
+
+    def send(job):
+        if job == 0:
+            # Cancelled while the first requests are in flight
+            control.cancel()
+            release.set()
+        release.wait()
+        sent.append(job)
+        return f"result {job}"
+
+    results = list(dispatch_in_order(range(100), send, concurrency=4, control=control))
+    assert results == [(job, f"result {job}") for job in sorted(sent)]
+    assert len(results) < 100
+
+
+def slow_jobs(count, pause_after, pause):
+    # Like a sheet whose next page is still downloading
+    for job in range(count):
+        if job == pause_after:
+            pause.wait(1)
+        yield job
+
+
+def test_iter_batches_groups_jobs_in_order():
+    stats = SendStats(batch_size=4)
+    assert list(iter_batches(range(10), batch_size=4, stats=stats)) == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+    assert (stats.batches, stats.messages) == (3, 10)
+    assert list(iter_batches(range(3), batch_size=1)) == [[0], [1], [2]]
+    assert list(iter_batches([], batch_size=4)) == []
+
+
+def test_iter_batches_flushes_a_partial_batch_after_the_interval():
+    pause = threading.Event()
+    stats = SendStats(batch_size=4, flush_interval=0.05)
+    batches = iter_batches(slow_jobs(6, 2, pause), batch_size=4, flush_interval=0.05, stats=stats)
+    # Sent while the rest of the jobs are not there yet
+    assert next(batches) == [0, 1]
+    pause.set()
+    assert list(batches) == [[2, 3, 4, 5]]
+    assert stats.timed_flushes == 1
+
+
+def test_iter_batches_raises_errors_of_the_job_source():
+    def failing_jobs():
+        yield 1
+        raise ValueError("sheet unreadable")
+
+    batches = iter_batches(failing_jobs(), batch_size=4)
+    assert next(batches) == [1]
+    with pytest.raises(ValueError):
+        next(batches)
+
+
+def test_dispatch_in_order_keeps_the_order_of_jobs():
+    def send(job):
+        # Later jobs finish first
+        time.sleep(0.001 * (20 - job))
+        return job * 2
+
+    for batch_size in (1, 3):
+        results = list(dispatch_in_order(range(20), send, concurrency=8, batch_size=batch_size))
+        assert results == [(job, job * 2) for job in range(20)]
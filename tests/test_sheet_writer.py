@@ -0,0 +1,18 @@
+from sheet_writer import column_letter, row_blocks, column_runs
+
+
+def test_column_letter():
+    assert [column_letter(index) for index in (0, 25, 26, 51, 701, 702)] == ["A", "Z", "AA", "AZ", "ZZ", "AAA"]
+
+
+def test_row_blocks_merges_nearby_rows():
+    assert row_blocks([]) == []
+    assert row_blocks([7, 2, 3, 4]) == [[2, 7]]
+    assert row_blocks([2, 3, 200, 201, 500], max_gap=100) == [[2, 3], [200, 201], [500, 500]]
+    assert row_blocks([2, 4], max_gap=0) == [[2, 2], [4, 4]]
+
+
+def test_column_runs_groups_adjacent_columns():
+    assert column_runs([4, 5, 6]) == [[(0, 4), (1, 5), (2, 6)]]
+    assert column_runs([4, 9, 10]) == [[(0, 4)], [(1, 9), (2, 10)]]
+    assert column_runs([]) == []
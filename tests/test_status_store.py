@@ -0,0 +1,70 @@
+import pytest
+
+from status_store import StatusStore, reference_id, campaign_of, campaign_id
+
+CAMPAIGN = "0123456789abcdef0123456789abcdef01234567"
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = StatusStore(str(tmp_path / "statuses.sqlite3"), flush_interval=0.01)
+    yield store
+    store.close()
+
+
+def status(store, reference):
+    store.flush()
+    return store.status(reference)["status"]
+
+
+def test_reference_id():
+    reference = reference_id(CAMPAIGN, "12:+14155550123")
+    assert reference == "0123456789abcdef/12"
+    assert campaign_of(reference) == campaign_id(CAMPAIGN)
+
+
+def test_late_ack_does_not_lower_the_status(store):
+    reference = reference_id(CAMPAIGN, "2:a")
+    store.record_sent(reference, "+14155550123", 7)
+    store.record_ack(reference, "read")
+    store.record_ack(reference, "device")
+    store.record_ack(reference, "server")
+    assert status(store, reference) == "read"
+
+
+def test_ack_faster_than_the_sent_record(store):
+    reference = reference_id(CAMPAIGN, "2:a")
+    store.record_ack(reference, "device")
+    store.flush()
+    store.record_sent(reference, "+14155550123", 7)
+    assert status(store, reference) == "device"
+    assert store.status(reference)["phone"] == "+14155550123"
+
+
+def test_sending_again_starts_over(store):
+    reference = reference_id(CAMPAIGN, "2:a")
+    store.record_sent(reference, "+14155550123", 7)
+    store.record_ack(reference, "read")
+    store.flush()
+    store.record_sent(reference, "+14155550123", 8)
+    assert status(store, reference) == "sent"
+
+
+def test_unknown_acks_are_ignored(store):
+    reference = reference_id(CAMPAIGN, "2:a")
+    store.record_sent(reference, "+14155550123")
+    store.record_ack(reference, "deleted")
+    assert status(store, reference) == "sent"
+
+
+def test_campaign_rates(store):
+    for row, ack in ((2, None), (3, "device"), (4, "read"), (5, "played")):
+        reference = reference_id(CAMPAIGN, f"{row}:+1")
+        store.record_sent(reference, "+1")
+        if ack:
+            store.record_ack(reference, ack)
+    store.flush()
+    rates = store.campaign_rates(CAMPAIGN)
+    assert (rates["sent"], rates["delivered"], rates["read"]) == (4, 3, 2)
+    assert rates["read_rate"] == 0.5
+    assert [campaign["campaign"] for campaign in store.campaigns()] == [campaign_id(CAMPAIGN)]
@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, ProtocolError
+
+from ultramsg_client import UltramsgClient, UNKNOWN_OUTCOME, is_connect_error, is_rejected
+
+OK = {"sent": "true", "id": 1}
+
+
+def answer(status_code=200, body=OK, retry_after=None):
+    def json():
+        if isinstance(body, Exception):
+            raise body
+        return body
+    headers = {"Retry-After": str(retry_after)} if retry_after is not None else {}
+    return SimpleNamespace(status_code=status_code, headers=headers, json=json)
+
+
+def connect_error():
+    return requests.ConnectionError(MaxRetryError(None, "http://mock/i/messages/chat"))
+
+
+class FakeSession:
+    """Plays back answers (or raises exceptions) in order and counts the requests."""
+
+    def __init__(self, answers):
+        self.answers = list(answers)
+        self.requests = 0
+
+    def post(self, url, **kwargs):
+        self.requests += 1
+        item = self.answers.pop(0)
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+
+def client_answering(*answers):
+    client = UltramsgClient("i", "t", rate=1000, max_rate=1000, max_attempts=3, api_url="http://mock")
+    client.session = FakeSession(answers)
+    client.wait_before_retry = lambda attempt, retry_after=None: None
+    return client
+
+
+@pytest.mark.parametrize("rejected", [connect_error(), requests.ConnectTimeout(), answer(429),
+                                      answer(503, retry_after=1)])
+def test_message_turned_away_before_processing_is_retried(rejected):
+    client = client_answering(rejected, answer())
+    assert client.send("chat", {"to": "+14155550123"}) == OK
+    assert client.session.requests == 2
+
+
+@pytest.mark.parametrize("unknown", [requests.ReadTimeout(), requests.ConnectionError(ProtocolError("reset")),
+                                     answer(500), answer(503), answer(200, ValueError("not JSON"))])
+def test_message_that_may_have_been_accepted_is_not_retried(unknown):
+    client = client_answering(unknown, answer())
+    assert client.send("chat", {"to": "+14155550123"}) is UNKNOWN_OUTCOME
+    assert client.session.requests == 1
+
+
+def test_message_rejected_on_every_attempt_returns_none():
+    client = client_answering(answer(429), connect_error(), answer(429))
+    assert client.send("chat", {"to": "+14155550123"}) is None
+    assert client.session.requests == 3
+
+
+def test_repeatable_request_is_retried_after_a_read_timeout():
+    client = client_answering(requests.ReadTimeout(), answer(500), answer(200, {"success": "true"}))
+    assert client.update_settings({"sendDelay": 2}) == {"success": "true"}
+    assert client.session.requests == 3
+
+
+def test_is_connect_error():
+    assert is_connect_error(connect_error())
+    assert is_connect_error(requests.ConnectTimeout())
+    assert not is_connect_error(requests.ReadTimeout())
+    assert not is_connect_error(requests.ConnectionError(ProtocolError("reset")))
+    assert not is_connect_error(requests.ConnectionError())
+
+
+def test_is_rejected():
+    assert is_rejected(429)
+    assert is_rejected(503, retry_after=5)
+    assert not is_rejected(503)
+    assert not is_rejected(500, retry_after=5)
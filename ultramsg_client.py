@@ -0,0 +1,232 @@
+import io
+import mimetypes
+import os
+import threading
+import time
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError
+
+from metrics import stage, count, HTTP_SEND
+from rate_limiter import AdaptiveRateLimiter, RetryPolicy, RETRY_STATUSES, DEFAULT_RATE, MAX_RATE, DEFAULT_MAX_ATTEMPTS
+
+API_URL = "https://api.ultramsg.com"
+
+DEFAULT_POOL_SIZE = 16
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+UPLOAD_READ_TIMEOUT = 300
+
+# Answer of post() when a message may have reached Ultramsg without a usable reply (read timeout, 5xx,
+# non-JSON body): it is reported as not sent, but never sent again, not even through another instance
+UNKNOWN_OUTCOME = {"sent": "unknown"}
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class MultipartFile:
+    """multipart/form-data body for one file that is read from disk while it is sent.
+
+    requests streams file-like bodies with a known length, so the upload never holds the whole file
+    in memory and still goes out with a Content-Length header.
+    """
+
+    def __init__(self, path, field="file"):
+        self.boundary = uuid.uuid4().hex
+        filename = os.path.basename(path)
+        content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        head = (f'--{self.boundary}\r\n'
+                f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+                f'Content-Type: {content_type}\r\n\r\n').encode("utf-8")
+        tail = f'\r\n--{self.boundary}--\r\n'.encode("utf-8")
+        self.length = len(head) + os.path.getsize(path) + len(tail)
+        self.parts = [io.BytesIO(head), open(path, "rb"), io.BytesIO(tail)]
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        chunks = []
+        while self.parts and (size < 0 or size > 0):
+            chunk = self.parts[0].read(size)
+            if not chunk:
+                self.parts.pop(0).close()
+                continue
+            chunks.append(chunk)
+            if size > 0:
+                size -= len(chunk)
+        return b"".join(chunks)
+
+    def close(self):
+        for part in self.parts:
+            part.close()
+
+
+class UltramsgClient:
+    def __init__(self, instance_id, token, pool_size=DEFAULT_POOL_SIZE, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, rate=DEFAULT_RATE, max_rate=MAX_RATE,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, api_url=API_URL):
+        self.instance_id = instance_id
+        self.token = token
+        self.base_url = f"{api_url}/{instance_id}"
+        self.timeout = (connect_timeout, read_timeout)
+        self.rate_limiter = AdaptiveRateLimiter(rate=rate, max_rate=max_rate)
+        self.retry_policy = RetryPolicy(max_attempts=max_attempts)
+
+        # One keep-alive pool per client, so every message reuses an already negotiated TLS connection
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Connection": "keep-alive"})
+
+    def post(self, path, data, reserved=False, repeatable=False):
+        """POST `data` and return the JSON answer, None or UNKNOWN_OUTCOME.
+
+        `reserved`: the rate limiter token for the first attempt was already taken by send_batch.
+        Requests that are not `repeatable`, i.e. messages, are only retried when Ultramsg cannot have
+        acted on them yet: the connection failed, or the answer was 429 or a 503 with Retry-After.
+        None means every attempt was turned away like that, so the request can go to another instance.
+        After a read timeout, another 5xx or a reply that is not JSON the message may be on its way,
+        and UNKNOWN_OUTCOME is returned instead: sending it again could deliver it twice.
+        """
+        for attempt in range(self.retry_policy.max_attempts):
+            if attempt or not reserved:
+                self.rate_limiter.acquire()
+            started = time.monotonic()
+            try:
+                with stage(HTTP_SEND):
+                    response = self.session.post(f"{self.base_url}/{path}", params={"token": self.token}, data=data,
+                                                 timeout=self.timeout)
+            except (requests.Timeout, requests.ConnectionError) as e:
+                count("http_responses_total", "Ultramsg responses by status", status=type(e).__name__)
+                self.rate_limiter.on_error()
+                if not (repeatable or is_connect_error(e)):
+                    return UNKNOWN_OUTCOME
+                self.wait_before_retry(attempt)
+                continue
+            except requests.RequestException as e:
+                count("http_responses_total", "Ultramsg responses by status", status=type(e).__name__)
+                return UNKNOWN_OUTCOME
+
+            count("http_responses_total", "Ultramsg responses by status", status=response.status_code)
+
+            if response.status_code in RETRY_STATUSES:
+                if response.status_code == 429:
+                    self.rate_limiter.on_throttled()
+                else:
+                    self.rate_limiter.on_error()
+                retry_after = retry_after_seconds(response)
+                if not (repeatable or is_rejected(response.status_code, retry_after)):
+                    return UNKNOWN_OUTCOME
+                self.wait_before_retry(attempt, retry_after)
+                continue
+
+            self.rate_limiter.on_success(time.monotonic() - started)
+            try:
+                return response.json()
+            except ValueError:
+                # Non-JSON bodies are reported as "not sent"
+                return UNKNOWN_OUTCOME
+
+        # Every attempt failed with a temporary error
+        return None
+
+    def wait_before_retry(self, attempt, retry_after=None):
+        # No point in waiting after the last attempt
+        if attempt + 1 < self.retry_policy.max_attempts:
+            time.sleep(self.retry_policy.delay(attempt, retry_after))
+
+    def upload(self, path):
+        """Upload a local file to Ultramsg's media storage and return its hosted URL, or None."""
+        for attempt in range(self.retry_policy.max_attempts):
+            self.rate_limiter.acquire()
+            body = MultipartFile(path)
+            try:
+                response = self.session.post(f"{self.base_url}/media/upload", params={"token": self.token},
+                                             data=body, headers={"Content-Type": body.content_type},
+                                             timeout=(self.timeout[0], UPLOAD_READ_TIMEOUT))
+            except (requests.Timeout, requests.ConnectionError):
+                self.rate_limiter.on_error()
+                self.wait_before_retry(attempt)
+                continue
+            except requests.RequestException:
+                return None
+            finally:
+                body.close()
+
+            if response.status_code in RETRY_STATUSES:
+                if response.status_code == 429:
+                    self.rate_limiter.on_throttled()
+                else:
+                    self.rate_limiter.on_error()
+                self.wait_before_retry(attempt, retry_after_seconds(response))
+                continue
+
+            try:
+                result = response.json()
+            except ValueError:
+                return None
+            if not isinstance(result, dict):
+                return None
+            return result.get("success") or result.get("url")
+
+        return None
+
+    def send(self, endpoint, data):
+        return self.post(f"messages/{endpoint}", data)
+
+    def send_batch(self, endpoint, batch):
+        """Send several messages back to back, reserving their rate limiter tokens in one go."""
+        self.rate_limiter.acquire(len(batch))
+        return [self.post(f"messages/{endpoint}", data, reserved=True) for data in batch]
+
+    def update_settings(self, data):
+        return self.post("instance/settings", data, repeatable=True)
+
+    def close(self):
+        self.session.close()
+
+
+def is_connect_error(e):
+    # The request never left: refused, unreachable or timed out while connecting, or the TLS handshake failed.
+    # requests wraps these in a MaxRetryError, errors after the request was written are not
+    if isinstance(e, requests.ConnectTimeout):
+        return True
+    return isinstance(e, requests.ConnectionError) and bool(e.args) and isinstance(e.args[0], MaxRetryError)
+
+
+def is_rejected(status_code, retry_after=None):
+    # Answers that say the request was turned away without being processed
+    return status_code == 429 or (status_code == 503 and retry_after is not None)
+
+
+def retry_after_seconds(response):
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def get_client(instance_id, token, pool_size=DEFAULT_POOL_SIZE, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+               read_timeout=DEFAULT_READ_TIMEOUT, rate=DEFAULT_RATE, max_rate=MAX_RATE,
+               max_attempts=DEFAULT_MAX_ATTEMPTS, api_url=API_URL):
+    # Clients are shared per instance so repeated sends from the GUI keep their warm connections
+    # and the rate the limiter has learned for that instance. Campaigns or profiles with other
+    # settings for the same instance get a client of their own
+    key = (instance_id, token, api_url, pool_size, connect_timeout, read_timeout, rate, max_rate, max_attempts)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = UltramsgClient(instance_id, token, pool_size=pool_size, connect_timeout=connect_timeout,
+                                    read_timeout=read_timeout, rate=rate, max_rate=max_rate,
+                                    max_attempts=max_attempts, api_url=api_url)
+            _clients[key] = client
+        return client
@@ -0,0 +1,194 @@
+"""Receiver for Ultramsg webhooks that keeps delivery statuses in the local status store.
+
+    python webhook_server.py --port 8088 --secret <secret>
+
+Set the instance's webhook URL to http://<host>:8088/webhook?secret=<secret> and enable message ack
+webhooks. Delivered and read rates of a campaign are served as JSON, with the same ?secret=<secret>:
+
+    GET /campaigns                  every campaign with its counts
+    GET /campaigns/<campaign id>    counts and rates of one campaign
+    GET /messages/<referenceId>     status of one message
+
+Without a secret the queries, which include recipients' phone numbers, are only answered on localhost.
+"""
+import argparse
+import asyncio
+import hmac
+import ipaddress
+import json
+import threading
+from urllib.parse import urlsplit, parse_qs, unquote
+
+from settings import get_app_file, STATUS_STORE_FILE
+from status_store import StatusStore
+
+DEFAULT_HOST = "0.0.0.0"
+DEFAULT_PORT = 8088
+WEBHOOK_PATH = "/webhook"
+# Webhook bodies are small; anything larger is not from Ultramsg
+MAX_BODY_SIZE = 1024 * 1024
+# Idle keep-alive connections are closed after this many seconds
+KEEP_ALIVE_TIMEOUT = 75
+
+REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large"}
+
+
+def parse_ack(payload):
+    """Return (referenceId, ack) of a message_ack webhook, or None for any other event."""
+    if not isinstance(payload, dict) or payload.get("event_type") != "message_ack":
+        return None
+    data = payload.get("data") or {}
+    reference = payload.get("referenceId") or data.get("referenceId")
+    ack = data.get("ack") or payload.get("ack")
+    if not reference or not ack:
+        return None
+    return reference, ack
+
+
+def is_loopback(peer):
+    try:
+        return ipaddress.ip_address(peer[0]).is_loopback
+    except (TypeError, IndexError, ValueError):
+        return False
+
+
+class WebhookReceiver:
+    """HTTP/1.1 keep-alive server on asyncio; acks are handed to the store's writer queue, so a burst of
+    callbacks is answered as fast as it can be parsed."""
+
+    def __init__(self, store, host=DEFAULT_HOST, port=DEFAULT_PORT, secret=None):
+        self.store = store
+        self.host = host
+        self.port = port
+        self.secret = secret
+        self.received = 0
+        self.loop = None
+        self.server = None
+        self.started = threading.Event()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+                    return
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                method, target, version = (request_line.split(" ") + ["", ""])[:3]
+                headers = {}
+                for line in header_lines:
+                    name, _, value = line.partition(":")
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length") or 0)
+                if length > MAX_BODY_SIZE:
+                    await self.respond(writer, 413, {"error": "body too large"}, keep_alive=False)
+                    return
+                body = await reader.readexactly(length) if length else b""
+
+                status, response = await self.route(method, target, body, writer.get_extra_info("peername"))
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                await self.respond(writer, status, response, keep_alive)
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            return
+        except asyncio.CancelledError:
+            # The server is shutting down with this connection still open
+            return
+        finally:
+            writer.close()
+
+    def has_secret(self, url):
+        return hmac.compare_digest(parse_qs(url.query).get("secret", [""])[0], self.secret)
+
+    async def route(self, method, target, body, peer=None):
+        url = urlsplit(target)
+        if url.path == WEBHOOK_PATH:
+            if method != "POST":
+                return 405, {"error": "POST only"}
+            if self.secret and not self.has_secret(url):
+                return 403, {"error": "bad secret"}
+            try:
+                payload = json.loads(body or b"null")
+            except ValueError:
+                return 400, {"error": "invalid JSON"}
+            ack = parse_ack(payload)
+            if ack:
+                self.store.record_ack(*ack)
+                self.received += 1
+            # Other events are acknowledged too, so Ultramsg does not retry them
+            return 200, {"ok": True}
+
+        if method != "GET":
+            return 405, {"error": "GET only"}
+        # Statuses hold phone numbers: with a secret it is required, without one only local clients are answered
+        if not (self.has_secret(url) if self.secret else is_loopback(peer)):
+            return 403, {"error": "bad secret" if self.secret else "local clients only"}
+        # Queries read SQLite, so they run off the event loop and never hold up incoming webhooks
+        return await asyncio.to_thread(self.query, url.path)
+
+    def query(self, path):
+        parts = [unquote(part) for part in path.strip("/").split("/", 1)]
+        if parts == ["campaigns"]:
+            return 200, self.store.campaigns()
+        if len(parts) == 2 and parts[0] == "campaigns":
+            return 200, self.store.campaign_rates(parts[1])
+        if len(parts) == 2 and parts[0] == "messages":
+            status = self.store.status(parts[1])
+            return (200, status) if status else (404, {"error": "unknown referenceId"})
+        return 404, {"error": "not found"}
+
+    async def respond(self, writer, status, body, keep_alive=True):
+        payload = json.dumps(body).encode("utf-8")
+        writer.write((f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                      f"Content-Type: application/json\r\n"
+                      f"Content-Length: {len(payload)}\r\n"
+                      f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode("latin-1") + payload)
+        await writer.drain()
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.started.set()
+        async with self.server:
+            try:
+                await self.server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+    def start(self):
+        # Run on a daemon thread next to the GUI or a campaign; returns once the port is bound
+        threading.Thread(target=asyncio.run, args=(self.serve(),), daemon=True, name="webhook-receiver").start()
+        self.started.wait()
+        return self
+
+    def stop(self):
+        if self.loop and self.server:
+            self.loop.call_soon_threadsafe(self.server.close)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Receive Ultramsg ack webhooks into the local status store.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--store", default=get_app_file(STATUS_STORE_FILE), help="status store file")
+    parser.add_argument("--secret", help="required ?secret= value of the webhook URL")
+    args = parser.parse_args(argv)
+
+    store = StatusStore(args.store)
+    receiver = WebhookReceiver(store, host=args.host, port=args.port, secret=args.secret)
+    print(f"Listening on http://{args.host}:{args.port}{WEBHOOK_PATH}")
+    try:
+        asyncio.run(receiver.serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()